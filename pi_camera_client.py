@@ -18,7 +18,10 @@ import argparse
 import io
 import json
 import logging
+import queue
+import shutil
 import signal
+import subprocess
 import sys
 import threading
 import time
@@ -53,61 +56,111 @@ CONFIG = {
     "pi_pass": "",
     "pi_port": 8554,
     "stream_channel": "101",  # 101 = main stream, 102 = sub stream
+    "sub_channel": "102",     # low-res channel for motion/tiles; None = main only
+    "passthrough": True,  # serve the native H.264 stream on /stream.ts
 }
 
 # ---------------------------------------------------------------------------
 # Camera connection
 # ---------------------------------------------------------------------------
 
+def _rtsp_url(channel):
+    return (
+        f"rtsp://{CONFIG['camera_user']}:{CONFIG['camera_pass']}"
+        f"@{CONFIG['camera_ip']}:{CONFIG['camera_rtsp_port']}"
+        f"/Streaming/Channels/{channel}"
+    )
+
+
 class CameraStream:
-    """Manages the RTSP connection to the Hikvision camera."""
+    """Manages one RTSP channel of the Hikvision camera.
 
-    def __init__(self):
+    An ``on_demand`` stream only decodes while someone reads frames: it
+    opens on first use and closes after ``idle_timeout`` seconds unused.
+    """
+
+    def __init__(self, name, channel_key, on_demand=False, idle_timeout=30):
+        self.name = name
+        self.channel_key = channel_key  # CONFIG key holding the channel id
+        self.on_demand = on_demand
+        self.idle_timeout = idle_timeout
+        self._last_used = time.time()
+        self._retry_at = 0
+        self._start_lock = threading.Lock()
         self.cap = None
         self.lock = threading.Lock()
+        # Signalled by the read loop each time a new frame is published
+        self.frame_ready = threading.Condition(self.lock)
         self.running = False
         self.last_frame = None
+        self.frame_seq = 0  # increments once per captured frame
         self.frame_count = 0
         self.fps = 0
         self._fps_time = time.time()
+        # Encoded JPEGs of the current frame, (width, quality) -> (frame_seq, bytes).
+        # Shared by every consumer so each frame is encoded once per variant.
+        self._jpeg_cache = {}
+        # Downscaled copies of the current frame, width -> (frame_seq, array)
+        self._resize_cache = {}
+        self._encode_lock = threading.Lock()
+
+    @property
+    def channel(self):
+        return CONFIG[self.channel_key]
 
     def start(self):
-        rtsp_url = (
-            f"rtsp://{CONFIG['camera_user']}:{CONFIG['camera_pass']}"
-            f"@{CONFIG['camera_ip']}:{CONFIG['camera_rtsp_port']}"
-            f"/Streaming/Channels/{CONFIG['stream_channel']}"
-        )
-        log.info(f"Connecting to camera RTSP: {CONFIG['camera_ip']}")
+        rtsp_url = _rtsp_url(self.channel)
+        log.info(f"Connecting to camera RTSP: {CONFIG['camera_ip']} channel {self.channel} ({self.name})")
 
         self.cap = cv2.VideoCapture(rtsp_url)
         if not self.cap.isOpened():
-            log.error("Failed to open RTSP stream!")
+            log.error(f"Failed to open RTSP stream {self.channel}!")
             return False
 
+        self._last_used = time.time()
         self.running = True
         self._thread = threading.Thread(target=self._read_loop, daemon=True)
         self._thread.start()
-        log.info("Camera stream started")
+        log.info(f"Camera stream started ({self.name})")
         return True
 
+    def _touch(self):
+        """Record a consumer; opens an idle on-demand stream."""
+        self._last_used = time.time()
+        if not self.on_demand or self.running:
+            return
+        with self._start_lock:
+            if not self.running and time.time() >= self._retry_at:
+                if not self.start():
+                    self._retry_at = time.time() + 10
+
     def _read_loop(self):
         while self.running:
+            if self.on_demand and time.time() - self._last_used > self.idle_timeout:
+                # Under the start lock so a consumer arriving now reopens cleanly
+                with self._start_lock:
+                    if time.time() - self._last_used > self.idle_timeout:
+                        log.info(f"Camera stream idle, closing ({self.name})")
+                        self.running = False
+                        self.cap.release()
+                        with self.lock:
+                            self.last_frame = None
+                        self.fps = 0
+                        return
+
             ret, frame = self.cap.read()
             if not ret:
-                log.warning("Frame read failed, reconnecting in 5s...")
+                log.warning(f"Frame read failed ({self.name}), reconnecting in 5s...")
                 time.sleep(5)
                 self.cap.release()
-                rtsp_url = (
-                    f"rtsp://{CONFIG['camera_user']}:{CONFIG['camera_pass']}"
-                    f"@{CONFIG['camera_ip']}:{CONFIG['camera_rtsp_port']}"
-                    f"/Streaming/Channels/{CONFIG['stream_channel']}"
-                )
-                self.cap = cv2.VideoCapture(rtsp_url)
+                self.cap = cv2.VideoCapture(_rtsp_url(self.channel))
                 continue
 
             with self.lock:
                 self.last_frame = frame
+                self.frame_seq += 1
                 self.frame_count += 1
+                self.frame_ready.notify_all()
 
             # Calculate FPS every 5 seconds
             now = time.time()
@@ -116,14 +169,89 @@ class CameraStream:
                 self.frame_count = 0
                 self._fps_time = now
 
-    def get_frame_jpeg(self, quality=80):
+    def get_frame(self):
+        """Return (frame_seq, frame) for the latest decoded frame.
+
+        The frame array is never modified after capture, so callers may read
+        it without holding the lock but must not write to it.
+        """
+        self._touch()
         with self.lock:
-            if self.last_frame is None:
+            return self.frame_seq, self.last_frame
+
+    def wait_for_frame(self, after_seq, timeout=5.0):
+        """Block until a frame newer than ``after_seq`` is available.
+
+        Returns the new frame sequence number, or None on timeout.
+        """
+        self._touch()
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(
+                lambda: self.frame_seq > after_seq, timeout=timeout
+            ):
                 return None
-            _, jpeg = cv2.imencode(
-                ".jpg", self.last_frame, [cv2.IMWRITE_JPEG_QUALITY, quality]
+            return self.frame_seq
+
+    def get_encoded_frame(self, quality=80, width=None):
+        """Return (frame_seq, jpeg_bytes) for the latest frame.
+
+        ``width`` downscales the frame (aspect kept) before encoding; None or
+        anything at least the native width means full resolution. Each frame
+        is resized at most once per width and encoded at most once per
+        (width, quality); concurrent consumers share the cached results.
+        Encoding happens outside ``self.lock`` so it never stalls capture.
+        """
+        seq, frame = self.get_frame()
+        if frame is None:
+            return seq, None
+        if width is not None and width >= frame.shape[1]:
+            width = None
+
+        key = (width, quality)
+        cached = self._jpeg_cache.get(key)
+        if cached and cached[0] >= seq:
+            return cached
+
+        with self._encode_lock:
+            # Capture may have moved on while we waited: encode the newest
+            # frame, and reuse it if another consumer already has
+            seq, frame = self.get_frame()
+            if frame is None:
+                return seq, None
+            cached = self._jpeg_cache.get(key)
+            if cached and cached[0] >= seq:
+                return cached
+            if width is not None:
+                frame = self._resized(seq, frame, width)
+            ok, jpeg = cv2.imencode(
+                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality]
             )
-            return jpeg.tobytes()
+            if not ok:
+                return seq, None
+            cached = (seq, jpeg.tobytes())
+            self._jpeg_cache[key] = cached
+            return cached
+
+    def _resized(self, seq, frame, width):
+        """Downscaled copy of frame ``seq``; caller holds ``_encode_lock``."""
+        cached = self._resize_cache.get(width)
+        if cached and cached[0] >= seq:
+            return cached[1]
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        self._resize_cache[width] = (seq, small)
+        return small
+
+    def get_frame_jpeg(self, quality=80):
+        return self.get_encoded_frame(quality)[1]
+
+    def status(self):
+        return {
+            "channel": self.channel,
+            "active": self.running,
+            "on_demand": self.on_demand,
+            "fps": round(self.fps, 1) if self.running else 0,
+        }
 
     def stop(self):
         self.running = False
@@ -131,7 +259,169 @@ class CameraStream:
             self.cap.release()
 
 
-camera_stream = CameraStream()
+# Consumers pick a channel by name: the main stream carries recording
+# quality (full-screen view, snapshots), the sub-stream is cheap to decode
+# (motion detection, grid tiles)
+camera_streams = {
+    "main": CameraStream("main", "stream_channel"),
+    "sub": CameraStream("sub", "sub_channel"),
+}
+
+
+def get_stream(name):
+    """The named CameraStream; everything uses main without a sub-stream."""
+    if name == "sub" and not CONFIG["sub_channel"]:
+        name = "main"
+    return camera_streams[name]
+
+
+def _stream_for_width(width):
+    """The cheapest channel that still covers ``width`` (None = full size)."""
+    if width is None:
+        return get_stream("main")
+    sub = get_stream("sub")
+    _, frame = sub.get_frame()
+    if frame is not None and width > frame.shape[1]:
+        return get_stream("main")
+    return sub
+
+# ---------------------------------------------------------------------------
+# H.264 passthrough (no decode / re-encode)
+# ---------------------------------------------------------------------------
+
+class H264Relay:
+    """Republishes the camera's native video stream as MPEG-TS over HTTP.
+
+    FFmpeg pulls RTSP and remuxes with ``-c copy``, so the Pi never decodes
+    or encodes. One FFmpeg process is shared by all subscribers; it starts on
+    the first subscriber and stops once nobody has listened for
+    ``idle_timeout`` seconds.
+    """
+
+    CHUNK_SIZE = 188 * 64  # whole TS packets
+    QUEUE_SIZE = 512       # ~6 MB of backlog before a client is dropped
+    STALL_TIMEOUT = 15     # seconds without output before FFmpeg is killed
+
+    def __init__(self, idle_timeout=10):
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.proc = None
+        self.subscribers = set()
+        self.bytes_relayed = 0
+        self.stalls = 0
+        self._last_data = time.monotonic()
+        self._idle_since = None
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(q)
+            self._idle_since = None
+            if self.proc is None or self.proc.poll() is not None:
+                self._start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+            if not self.subscribers:
+                self._idle_since = time.time()
+
+    def _start(self):
+        cmd = [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel", "error",
+            "-rtsp_transport", "tcp",
+            "-i", _rtsp_url(CONFIG["stream_channel"]),
+            "-map", "0:v:0",
+            "-c", "copy",
+            "-f", "mpegts",
+            "pipe:1",
+        ]
+        log.info("Starting H.264 passthrough relay")
+        self.proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self._last_data = time.monotonic()
+        threading.Thread(target=self._pump, args=(self.proc,), daemon=True).start()
+        threading.Thread(target=self._watchdog, args=(self.proc,), daemon=True).start()
+
+    def _watchdog(self, proc):
+        """Kill FFmpeg if it stops producing output (e.g. a dead RTSP session).
+
+        The pump then sees EOF and ends every open response; the next
+        subscriber (the server's recorder reconnecting) starts a fresh process.
+        """
+        while proc.poll() is None:
+            time.sleep(self.STALL_TIMEOUT / 3)
+            with self.lock:
+                stalled = self.proc is proc and \
+                    time.monotonic() - self._last_data > self.STALL_TIMEOUT
+                if stalled:
+                    self.stalls += 1
+            if stalled:
+                log.warning(f"Passthrough relay produced no data for {self.STALL_TIMEOUT}s, restarting")
+                proc.kill()
+                return
+
+    def _pump(self, proc):
+        while True:
+            chunk = proc.stdout.read1(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            with self.lock:
+                self.bytes_relayed += len(chunk)
+                self._last_data = time.monotonic()
+                if not self.subscribers and self._idle_since is not None and \
+                   time.time() - self._idle_since > self.idle_timeout:
+                    # Detach now so the next subscriber starts a fresh process
+                    self.proc = None
+                    break
+                for q in list(self.subscribers):
+                    try:
+                        q.put_nowait(chunk)
+                    except queue.Full:
+                        # Dropping TS packets would corrupt the stream, so a
+                        # client that cannot keep up is disconnected instead
+                        log.warning("Passthrough client too slow, dropping it")
+                        self.subscribers.discard(q)
+                        self._close_queue(q)
+
+        if proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        with self.lock:
+            if self.proc is proc:
+                # FFmpeg exited on its own; end every open response
+                self.proc = None
+                for q in self.subscribers:
+                    self._close_queue(q)
+                self.subscribers.clear()
+        log.info("H.264 passthrough relay stopped")
+
+    @staticmethod
+    def _close_queue(q):
+        """Wake the consumer with an end-of-stream marker."""
+        while True:
+            try:
+                q.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def is_running(self):
+        with self.lock:
+            return self.proc is not None and self.proc.poll() is None
+
+
+h264_relay = H264Relay()
 
 # ---------------------------------------------------------------------------
 # Hikvision ISAPI helpers (for zoom control)
@@ -238,9 +528,11 @@ def camera_get_device_info():
 # ---------------------------------------------------------------------------
 
 class MotionDetector:
-    def __init__(self, threshold=25, min_area=5000, cooldown=10):
+    def __init__(self, threshold=25, min_area_fraction=0.0012, cooldown=10):
         self.threshold = threshold
-        self.min_area = min_area
+        # Relative to the frame so sensitivity does not depend on the channel
+        # (0.0012 is about 5000 px of a 2688x1520 main stream)
+        self.min_area_fraction = min_area_fraction
         self.cooldown = cooldown
         self.prev_gray = None
         self.last_alert_time = 0
@@ -255,14 +547,13 @@ class MotionDetector:
 
     def _detect_loop(self):
         while self.running:
-            frame_jpeg = camera_stream.get_frame_jpeg()
-            if frame_jpeg is None:
+            # Work on the raw sub-stream frame; no JPEG round trip needed
+            _, frame = get_stream("sub").get_frame()
+            if frame is None:
                 time.sleep(0.5)
                 continue
 
-            # Decode and convert to grayscale
-            nparr = __import__("numpy").frombuffer(frame_jpeg, __import__("numpy").uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # Convert to grayscale
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             gray = cv2.GaussianBlur(gray, (21, 21), 0)
 
@@ -279,8 +570,9 @@ class MotionDetector:
                 thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
             )
 
+            min_area = self.min_area_fraction * gray.shape[0] * gray.shape[1]
             motion_detected = any(
-                cv2.contourArea(c) > self.min_area for c in contours
+                cv2.contourArea(c) > min_area for c in contours
             )
 
             now = time.time()
@@ -345,31 +637,81 @@ def require_auth(f):
     return decorated
 
 
+STREAM_MIN_WIDTH = 160
+
+
 @app.route("/stream")
 @require_auth
 def stream():
-    """MJPEG stream endpoint."""
+    """MJPEG stream endpoint.
+
+    Optional ``?width=`` (pixels, aspect kept) and ``?quality=`` (JPEG,
+    default 70) select a smaller variant, e.g. for grid tiles. Widths are
+    rounded to a multiple of 16 so clients share cached variants. Sized
+    requests are served from the sub-stream when it is wide enough, full
+    size from the main stream; ``?channel=main|sub`` picks one explicitly.
+    """
+    width = request.args.get("width", type=int)
+    if width is not None:
+        width = max(STREAM_MIN_WIDTH, width // 16 * 16)
+    quality = min(max(request.args.get("quality", 70, type=int), 10), 95)
+    channel = request.args.get("channel")
+    camera_stream = get_stream(channel) if channel in camera_streams else _stream_for_width(width)
+
     def generate():
+        last_seq = 0
         while True:
-            frame = camera_stream.get_frame_jpeg(quality=70)
+            # Wake up as soon as the camera publishes a new frame, so every
+            # frame is sent exactly once and nothing is re-sent while idle
+            if camera_stream.wait_for_frame(last_seq) is None:
+                continue
+            last_seq, frame = camera_stream.get_encoded_frame(quality=quality, width=width)
             if frame is None:
-                time.sleep(0.1)
                 continue
+            # Content-Length lets the server emit the frame as soon as its
+            # bytes arrive instead of waiting for the next boundary
             yield (
                 b"--frame\r\n"
-                b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
+                b"Content-Type: image/jpeg\r\n"
+                b"Content-Length: " + str(len(frame)).encode() + b"\r\n\r\n"
+                + frame + b"\r\n"
             )
-            time.sleep(0.04)  # ~25 fps max
 
     return Response(
         generate(), mimetype="multipart/x-mixed-replace; boundary=frame"
     )
 
 
+@app.route("/stream.ts")
+@require_auth
+def stream_ts():
+    """Native H.264 stream remuxed to MPEG-TS (no transcoding)."""
+    if not CONFIG["passthrough"]:
+        return "Passthrough disabled", 404
+
+    def generate():
+        q = h264_relay.subscribe()
+        try:
+            while True:
+                chunk = q.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            h264_relay.unsubscribe(q)
+
+    return Response(generate(), mimetype="video/mp2t")
+
+
 @app.route("/snapshot")
 @require_auth
 def snapshot():
     """Single JPEG frame."""
+    camera_stream = get_stream("main")
+    seq, frame = camera_stream.get_frame()
+    if frame is None:
+        # An idle on-demand stream is just (re)opening
+        camera_stream.wait_for_frame(seq, timeout=10)
     frame = camera_stream.get_frame_jpeg(quality=95)
     if frame is None:
         return "No frame available", 503
@@ -382,8 +724,18 @@ def status():
     """Pi and camera health status."""
     return jsonify({
         "online": True,
-        "camera_connected": camera_stream.cap is not None and camera_stream.cap.isOpened(),
-        "fps": round(camera_stream.fps, 1),
+        "camera_connected": any(
+            s.cap is not None and s.cap.isOpened() for s in camera_streams.values()
+        ),
+        "fps": round(get_stream("sub").fps, 1),
+        "streams": {
+            name: camera_streams[name].status()
+            for name in (("main", "sub") if CONFIG["sub_channel"] else ("main",))
+        },
+        "passthrough": CONFIG["passthrough"],
+        "passthrough_active": h264_relay.is_running(),
+        "passthrough_clients": len(h264_relay.subscribers),
+        "passthrough_stalls": h264_relay.stalls,
         "timestamp": datetime.utcnow().isoformat(),
         "motion_events_count": len(motion_detector.events),
     })
@@ -439,6 +791,7 @@ def register_with_server():
         "pi_ip": local_ip,
         "pi_port": CONFIG["pi_port"],
         "camera_model": "Hikvision DS-2CD2743G2-IZS",
+        "passthrough": CONFIG["passthrough"],
     }
 
     for attempt in range(5):
@@ -477,7 +830,12 @@ def main():
     parser.add_argument("--pi-pass", required=True, help="Password for this Pi")
     parser.add_argument("--pi-port", type=int, default=8554, help="Port for Pi's local server")
     parser.add_argument("--channel", default="101", help="RTSP channel (101=main, 102=sub)")
+    parser.add_argument("--sub-channel", default="102",
+                        help="Low-res RTSP channel for motion detection and grid tiles "
+                             "('none' to use --channel for everything)")
     parser.add_argument("--no-motion", action="store_true", help="Disable motion detection")
+    parser.add_argument("--no-passthrough", action="store_true",
+                        help="Disable the H.264 passthrough stream (/stream.ts)")
     args = parser.parse_args()
 
     CONFIG.update({
@@ -491,10 +849,22 @@ def main():
         "pi_pass": args.pi_pass,
         "pi_port": args.pi_port,
         "stream_channel": args.channel,
+        "sub_channel": None if args.sub_channel.lower() in ("", "none", "off") else args.sub_channel,
+        "passthrough": not args.no_passthrough,
     })
 
-    # Start camera stream
-    if not camera_stream.start():
+    if CONFIG["passthrough"] and shutil.which("ffmpeg") is None:
+        log.warning("ffmpeg not found, H.264 passthrough disabled")
+        CONFIG["passthrough"] = False
+
+    # Start camera streams. With a sub-stream running continuously, the
+    # main stream is only decoded while someone watches it full size.
+    if CONFIG["sub_channel"] and not camera_streams["sub"].start():
+        log.warning("Could not open sub-stream, using the main stream for everything")
+        CONFIG["sub_channel"] = None
+    if CONFIG["sub_channel"]:
+        camera_streams["main"].on_demand = True
+    elif not camera_streams["main"].start():
         log.error("Could not start camera stream. Exiting.")
         sys.exit(1)
 
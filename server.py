@@ -17,17 +17,28 @@ Usage:
 """
 
 import argparse
+import atexit
+import bisect
+import collections
+import ctypes
+import ctypes.util
 import hashlib
+import heapq
 import json
 import logging
+import math
 import os
+import queue
 import signal
 import sqlite3
+import struct
 import subprocess
 import sys
 import threading
 import time
-from datetime import datetime, timedelta
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import requests
@@ -36,6 +47,12 @@ from flask import (
     request, send_file, url_for,
 )
 
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # only needed for the server-side mosaic view
+    cv2 = np = None
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
@@ -56,22 +73,99 @@ app.secret_key = os.urandom(32)
 RECORDINGS_DIR = DEFAULT_RECORDINGS_DIR
 SEGMENT_DURATION = 600  # 10-minute segments
 MAX_AGE_HOURS = 48
+MAX_DISK_GB = None       # byte budget across all cameras (None = unlimited)
+CAMERA_QUOTA_GB = None   # default per-camera budget; cameras.quota_gb overrides
+RETENTION_INTERVAL = 30       # seconds between retention passes
+RETENTION_MAX_DELETES = 50    # files deleted per pass at most
+
+EXPORTS_DIR = DEFAULT_RECORDINGS_DIR / "exports"
+EXPORT_WORKERS = 2            # concurrent FFmpeg export jobs
+EXPORT_CACHE_GB = 5           # finished clips kept on disk (LRU)
+EXPORT_MAX_SECONDS = 6 * 3600  # longest clip a single job may cover
 HEALTH_CHECK_INTERVAL = 30  # seconds
-
-# Active FFmpeg recording processes
-recording_processes = {}  # camera_id -> subprocess.Popen
+HEALTH_CHECK_TIMEOUT = 5    # seconds per Pi /status probe
+HEALTH_CHECK_WORKERS = 32   # probes in flight at once
+
+# How FFmpeg writes recordings. "copy" remuxes the Pi's native H.264/H.265
+# stream (/stream.ts) without re-encoding, "transcode" encodes the MJPEG
+# stream with libx264, "auto" copies whenever the Pi offers passthrough.
+RECORDING_MODES = ("auto", "copy", "transcode")
+RECORDING_MODE = "auto"
+
+# Segment container. "fmp4" (fragmented MP4) and "ts" (MPEG-TS) stay playable
+# while being written and survive an FFmpeg/server crash; plain "mp4" only
+# gets its index (moov atom) when the segment closes.
+RECORDING_FORMATS = ("fmp4", "ts", "mp4")
+RECORDING_FORMAT = "fmp4"
+SEGMENT_EXTENSIONS = (".mp4", ".ts")
+
+# Active FFmpeg recorders
+recorders = {}  # camera_id -> RecordingSupervisor
 recording_lock = threading.Lock()
 
 # ---------------------------------------------------------------------------
 # Database
 # ---------------------------------------------------------------------------
 
-def get_db():
-    conn = sqlite3.connect(str(DB_PATH))
+DB_POOL_SIZE = 16  # idle connections kept for reuse
+
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+class _PooledConnection:
+    """Connection handed out by get_db(); close() returns it to the pool.
+
+    Everything else is delegated to the underlying sqlite3 connection, so
+    callers keep the usual ``conn = get_db() ... conn.close()`` pattern.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _db_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def _connect_db():
+    # Connections move between Flask worker threads via the pool, but each is
+    # only ever used by one thread at a time
+    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-16384")     # 16 MB page cache
+    conn.execute("PRAGMA mmap_size=268435456")   # 256 MB memory-mapped I/O
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
     return conn
 
+
+def get_db():
+    """Borrow a pooled connection (pragmas and statement cache already warm)."""
+    try:
+        conn = _db_pool.get_nowait()
+    except queue.Empty:
+        conn = _connect_db()
+    return _PooledConnection(conn)
+
 def init_db():
     conn = get_db()
     conn.executescript("""
@@ -86,7 +180,10 @@ def init_db():
             is_online INTEGER DEFAULT 0,
             last_seen TEXT,
             created_at TEXT DEFAULT (datetime('now')),
-            zoom_capable INTEGER DEFAULT 1
+            zoom_capable INTEGER DEFAULT 1,
+            passthrough INTEGER DEFAULT 0,
+            recording_mode TEXT,
+            quota_gb REAL
         );
 
         CREATE TABLE IF NOT EXISTS events (
@@ -96,16 +193,77 @@ def init_db():
             message TEXT,
             timestamp TEXT NOT NULL,
             created_at TEXT DEFAULT (datetime('now')),
+            segment_path TEXT,
+            segment_offset REAL,
+            ts_ms INTEGER,
+            FOREIGN KEY (camera_id) REFERENCES cameras(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            camera_id INTEGER NOT NULL,
+            path TEXT UNIQUE NOT NULL,
+            start_ts REAL NOT NULL,
+            end_ts REAL,
+            bytes INTEGER DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'recording',
             FOREIGN KEY (camera_id) REFERENCES cameras(id)
         );
 
-        CREATE INDEX IF NOT EXISTS idx_events_camera ON events(camera_id);
-        CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_segments_camera_start ON segments(camera_id, start_ts);
+        CREATE INDEX IF NOT EXISTS idx_segments_end ON segments(end_ts);
+
+        CREATE TABLE IF NOT EXISTS event_rollups (
+            camera_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            hour_ts INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (event_type, hour_ts, camera_id)
+        ) WITHOUT ROWID;
+    """)
+    # Columns added after the first release; older databases lack them
+    _add_missing_columns(conn, "cameras", {
+        "passthrough": "INTEGER DEFAULT 0",
+        "recording_mode": "TEXT",
+        "quota_gb": "REAL",
+    })
+    _add_missing_columns(conn, "events", {
+        "segment_path": "TEXT",
+        "segment_offset": "REAL",
+        "ts_ms": "INTEGER",
+    })
+    # Integer epoch for range scans and keyset paging; backfill old rows
+    # from the ISO text (UTC) once
+    conn.execute("""
+        UPDATE events
+        SET ts_ms = CAST(round((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER)
+        WHERE ts_ms IS NULL
     """)
+    conn.executescript("""
+        DROP INDEX IF EXISTS idx_events_camera;
+        DROP INDEX IF EXISTS idx_events_timestamp;
+        CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events(camera_id, ts_ms, id);
+        CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts_ms, id);
+        CREATE INDEX IF NOT EXISTS idx_events_segment ON events(segment_path);
+    """)
+    # Seed the hourly rollups from history the first time they exist
+    if conn.execute("SELECT 1 FROM event_rollups LIMIT 1").fetchone() is None:
+        conn.execute("""
+            INSERT INTO event_rollups (camera_id, event_type, hour_ts, count)
+            SELECT camera_id, event_type, ts_ms / 3600000 * 3600, COUNT(*)
+            FROM events WHERE camera_id IS NOT NULL AND ts_ms IS NOT NULL
+            GROUP BY camera_id, event_type, ts_ms / 3600000
+        """)
     conn.commit()
     conn.close()
     log.info("Database initialized")
 
+def _add_missing_columns(conn, table, columns):
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -132,100 +290,1102 @@ def get_camera_by_user(pi_user):
     return dict(cam) if cam else None
 
 # ---------------------------------------------------------------------------
-# Recording management (FFmpeg)
+# Live stream fan-out
 # ---------------------------------------------------------------------------
 
-def start_recording(camera):
-    """Start FFmpeg recording for a camera."""
-    cam_id = camera["id"]
+def iter_mjpeg_frames(chunks, boundary=b"frame"):
+    """Split a multipart/x-mixed-replace byte stream into JPEG payloads."""
+    delim = b"--" + boundary
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            start = buf.find(delim)
+            if start < 0:
+                # Keep a tail in case the delimiter straddles two chunks
+                del buf[:max(0, len(buf) - len(delim))]
+                break
+            header_end = buf.find(b"\r\n\r\n", start)
+            if header_end < 0:
+                break
+            body_start = header_end + 4
+            length = _part_content_length(buf[start:header_end])
+            if length is not None:
+                if len(buf) < body_start + length:
+                    break
+                body = bytes(buf[body_start:body_start + length])
+                del buf[:body_start + length]
+            else:
+                next_delim = buf.find(delim, body_start)
+                if next_delim < 0:
+                    break
+                body = bytes(buf[body_start:next_delim])
+                if body.endswith(b"\r\n"):
+                    body = body[:-2]
+                del buf[:next_delim]
+            if body:
+                yield body
+
+
+def _part_content_length(headers):
+    for line in bytes(headers).split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            try:
+                return int(value.strip())
+            except ValueError:
+                return None
+    return None
+
+
+def mjpeg_part(frame):
+    return (
+        b"--frame\r\n"
+        b"Content-Type: image/jpeg\r\n"
+        b"Content-Length: " + str(len(frame)).encode() + b"\r\n\r\n"
+        + frame + b"\r\n"
+    )
 
-    with recording_lock:
-        if cam_id in recording_processes:
-            proc = recording_processes[cam_id]
-            if proc.poll() is None:
-                log.info(f"Recording already active for camera {cam_id}")
+
+STREAM_NO_FRAME_TIMEOUT = 60  # end a viewer that never got a frame after this
+
+
+class StreamHub:
+    """Shares one upstream MJPEG connection to a Pi between all consumers.
+
+    The upstream reader starts with the first subscriber and is torn down
+    once nobody has been subscribed for ``idle_timeout`` seconds, so Pi WiFi
+    upload stays at one stream no matter how many browsers are watching.
+
+    Only the latest frame is kept. A viewer that is slow to drain its socket
+    simply picks up whatever frame is current when it is ready again, so it
+    never accumulates a backlog and never holds up the upstream or others.
+    """
+
+    def __init__(self, cam_id, width=None, quality=None, idle_timeout=5):
+        self.cam_id = cam_id
+        self.width = width      # downscaled variant from the Pi; None = full
+        self.quality = quality  # JPEG quality asked of the Pi; None = its default
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.subscribers = 0
+        self.running = False
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0  # frames a viewer skipped to stay current
+        self.thread = None  # producer thread of the current/last run
+        self.closed = False  # camera is gone; viewers should end
+        self._idle_since = None
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+            self._idle_since = None
+            if not self.running:
+                self.running = True
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+            if self.subscribers <= 0:
+                self.subscribers = 0
+                self._idle_since = time.time()
+
+    def wait_frame(self, after_seq, timeout=10):
+        """Return (seq, jpeg) newer than ``after_seq``; jpeg is None on timeout."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq or self.closed,
+                                      timeout=timeout) or self.seq <= after_seq:
+                return after_seq, None
+            return self.seq, self.frame
+
+    def close(self):
+        """End every viewer (the camera was deleted)."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def frames(self, max_fps=None):
+        """Generator of multipart parts for one HTTP viewer.
+
+        ``max_fps`` caps the rate sent to this viewer; frames published in
+        between are skipped rather than queued.
+        """
+        min_interval = 1.0 / max_fps if max_fps else 0
+        self.subscribe()
+        try:
+            seq = 0
+            next_send = 0
+            last_sent = time.monotonic()
+            while True:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                new_seq, frame = self.wait_frame(seq)
+                if self.closed:
+                    return
+                if frame is None:
+                    # Upstream is down. Werkzeug only notices a closed client
+                    # on write, so repeat the last frame as a keep-alive; with
+                    # nothing to repeat, end the response after a while (the
+                    # browser retries) rather than hold the Pi subscription
+                    with self.cond:
+                        frame = self.frame
+                    if frame is None:
+                        if time.monotonic() - last_sent > STREAM_NO_FRAME_TIMEOUT:
+                            return
+                        continue
+                    last_sent = time.monotonic()
+                    yield mjpeg_part(frame)
+                    continue
+                if seq:
+                    skipped = new_seq - seq - 1
+                    if skipped > 0:
+                        with self.cond:
+                            self.frames_dropped += skipped
+                seq = new_seq
+                last_sent = time.monotonic()
+                next_send = last_sent + min_interval
+                yield mjpeg_part(frame)
+                with self.cond:
+                    self.frames_sent += 1
+        finally:
+            self.unsubscribe()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "camera_id": self.cam_id,
+                "width": self.width,
+                "quality": self.quality,
+                "upstream_open": self.running,
+                "viewers": self.subscribers,
+                "frames_received": self.frames_received,
+                "frames_sent": self.frames_sent,
+                "frames_dropped": self.frames_dropped,
+            }
+
+    def _idle(self):
+        with self.cond:
+            if self.subscribers > 0 or self._idle_since is None:
+                return False
+            if time.time() - self._idle_since < self.idle_timeout:
+                return False
+            self.running = False
+            return True
+
+    def _run(self):
+        log.info(f"Opening upstream stream for camera {self.cam_id}")
+        while not self._idle():
+            cam = get_camera(self.cam_id)
+            if not cam or not cam["pi_ip"]:
+                with self.cond:
+                    self.running = False
+                if not cam:
+                    self.close()
                 return
+            pi_pass = _pi_passwords.get(cam["pi_user"], "")
+            params = {k: v for k, v in (("width", self.width), ("quality", self.quality))
+                      if v is not None}
+            try:
+                with requests.get(
+                    f"http://{cam['pi_ip']}:{cam['pi_port']}/stream",
+                    params=params,
+                    auth=(cam["pi_user"], pi_pass),
+                    stream=True,
+                    timeout=30,
+                ) as r:
+                    r.raise_for_status()
+                    for frame in iter_mjpeg_frames(r.iter_content(chunk_size=65536)):
+                        with self.cond:
+                            self.frame = frame
+                            self.seq += 1
+                            self.frames_received += 1
+                            self.cond.notify_all()
+                        if self._idle():
+                            break
+            except Exception as e:
+                log.error(f"Upstream stream error for camera {self.cam_id}: {e}")
+                time.sleep(2)
+        log.info(f"Closed upstream stream for camera {self.cam_id}")
+
+
+stream_hubs = {}  # (camera_id, width, quality) -> StreamHub
+stream_hubs_lock = threading.Lock()
+
+STREAM_TILE_WIDTH = 480  # grid tiles and mosaic tiles
+# Each variant is its own upstream connection to the Pi, so clients only get
+# a few: requests snap up to the next width here (wider means full size) and
+# to the nearest quality
+STREAM_WIDTHS = (240, STREAM_TILE_WIDTH, 960)
+STREAM_QUALITIES = (50, 70, 90)
+
+
+def _stream_variant(width, quality):
+    if width is not None:
+        width = next((w for w in STREAM_WIDTHS if w >= width), None)
+    if quality is not None:
+        quality = min(STREAM_QUALITIES, key=lambda q: abs(q - quality))
+    return width, quality
+
+
+def get_stream_hub(cam_id, width=None, quality=None):
+    """Shared hub for one stream variant of a camera (None = Pi default)."""
+    width, quality = _stream_variant(width, quality)
+    key = (cam_id, width, quality)
+    with stream_hubs_lock:
+        hub = stream_hubs.get(key)
+        if hub is None:
+            # Drop variants whose last viewer has gone and whose upstream closed
+            for old_key, old in list(stream_hubs.items()):
+                with old.cond:
+                    finished = old.subscribers == 0 and old.thread is not None and not old.running
+                if finished:
+                    del stream_hubs[old_key]
+            hub = stream_hubs[key] = StreamHub(cam_id, width, quality)
+        return hub
 
-    cam_dir = RECORDINGS_DIR / str(cam_id)
+# ---------------------------------------------------------------------------
+# Mosaic (many cameras in one MJPEG stream)
+# ---------------------------------------------------------------------------
+
+MOSAIC_TILE_WIDTH = STREAM_TILE_WIDTH
+MOSAIC_TILE_HEIGHT = 270
+MOSAIC_QUALITY = 70
+MOSAIC_MAX_TILES = 36
+MOSAIC_DEFAULT_FPS = 5
+MOSAIC_MAX_FPS = 15
+
+
+class MosaicHub(StreamHub):
+    """Composites the latest frame of several camera hubs into one stream.
+
+    Browsers cap HTTP/1.1 connections per host at about six, so a grid of
+    many MJPEG tiles stalls; a mosaic is one connection and one decode. It
+    rides on the per-camera hubs (no extra load on the Pis), only re-decodes
+    tiles whose camera produced a new frame, and like a StreamHub is shared
+    by all viewers of the same layout and torn down when idle.
+    """
+
+    def __init__(self, cam_ids, cols, rows, fps):
+        super().__init__(f"mosaic:{','.join(map(str, cam_ids))}@{cols}x{rows}/{fps}")
+        self.cam_ids = cam_ids
+        self.cols = cols
+        self.rows = rows
+        self.fps = fps
+
+    def _decode_tile(self, jpeg, reduce_flag):
+        img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), reduce_flag)
+        if img is None:
+            return None, reduce_flag
+        # Let libjpeg do most of the downscaling (DCT scaling) next time
+        scale = img.shape[1] * {
+            cv2.IMREAD_COLOR: 1, cv2.IMREAD_REDUCED_COLOR_2: 2,
+            cv2.IMREAD_REDUCED_COLOR_4: 4, cv2.IMREAD_REDUCED_COLOR_8: 8,
+        }[reduce_flag]
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR)):
+            if scale // factor >= MOSAIC_TILE_WIDTH:
+                break
+        # Letterbox: sub-streams are often 4:3, tiles are 16:9
+        h, w = img.shape[:2]
+        fit = min(MOSAIC_TILE_WIDTH / w, MOSAIC_TILE_HEIGHT / h)
+        fw, fh = max(1, round(w * fit)), max(1, round(h * fit))
+        tile = np.zeros((MOSAIC_TILE_HEIGHT, MOSAIC_TILE_WIDTH, 3), np.uint8)
+        x, y = (MOSAIC_TILE_WIDTH - fw) // 2, (MOSAIC_TILE_HEIGHT - fh) // 2
+        tile[y:y + fh, x:x + fw] = cv2.resize(img, (fw, fh), interpolation=cv2.INTER_AREA)
+        return tile, flag
+
+    def _run(self):
+        log.info(f"Opening {self.cam_id}")
+        names = {}
+        for cid in self.cam_ids:
+            cam = get_camera(cid)
+            names[cid] = cam["name"] if cam else f"Camera {cid}"
+        # Ask the Pis for tile-sized frames; decode then costs next to nothing
+        hubs = [get_stream_hub(cid, width=MOSAIC_TILE_WIDTH) for cid in self.cam_ids]
+        for hub in hubs:
+            hub.subscribe()
+        canvas = np.zeros((self.rows * MOSAIC_TILE_HEIGHT, self.cols * MOSAIC_TILE_WIDTH, 3), np.uint8)
+        seqs = [0] * len(hubs)
+        flags = [cv2.IMREAD_COLOR] * len(hubs)
+        interval = 1.0 / self.fps
+        dirty = True
+        try:
+            while not self._idle():
+                started = time.monotonic()
+                try:
+                    for i, hub in enumerate(hubs):
+                        with hub.cond:
+                            seq, jpeg = hub.seq, hub.frame
+                        if jpeg is None or seq == seqs[i]:
+                            continue
+                        seqs[i] = seq
+                        tile, flags[i] = self._decode_tile(jpeg, flags[i])
+                        if tile is None:
+                            continue
+                        cv2.putText(tile, names[self.cam_ids[i]], (10, MOSAIC_TILE_HEIGHT - 12),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+                        row, col = divmod(i, self.cols)
+                        y, x = row * MOSAIC_TILE_HEIGHT, col * MOSAIC_TILE_WIDTH
+                        canvas[y:y + MOSAIC_TILE_HEIGHT, x:x + MOSAIC_TILE_WIDTH] = tile
+                        dirty = True
+                    if dirty:
+                        ok, buf = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, MOSAIC_QUALITY])
+                        if ok:
+                            with self.cond:
+                                self.frame = buf.tobytes()
+                                self.seq += 1
+                                self.frames_received += 1
+                                self.cond.notify_all()
+                        dirty = False
+                except Exception as e:
+                    # Keep compositing for the viewers still attached, like a
+                    # StreamHub reconnecting upstream
+                    log.error(f"{self.cam_id} failed, retrying: {e}")
+                    time.sleep(2)
+                    continue
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        finally:
+            for hub in hubs:
+                hub.unsubscribe()
+        log.info(f"Closed {self.cam_id}")
+
+
+mosaic_hubs = {}  # (cam_ids, cols, rows, fps) -> MosaicHub
+mosaic_hubs_lock = threading.Lock()
+
+
+def get_mosaic_hub(cam_ids, cols, rows, fps):
+    key = (tuple(cam_ids), cols, rows, fps)
+    with mosaic_hubs_lock:
+        hub = mosaic_hubs.get(key)
+        if hub is None:
+            # Layouts nobody watches any more are dropped as new ones appear;
+            # a hub whose viewer has not subscribed yet has never run
+            for old_key, old in list(mosaic_hubs.items()):
+                with old.cond:
+                    finished = old.subscribers == 0 and old.thread is not None and not old.running
+                if finished:
+                    del mosaic_hubs[old_key]
+            hub = mosaic_hubs[key] = MosaicHub(list(cam_ids), cols, rows, fps)
+        return hub
+
+# ---------------------------------------------------------------------------
+# Recording management (FFmpeg)
+# ---------------------------------------------------------------------------
+
+def _recording_command(camera):
+    """Build the FFmpeg command line; returns (cmd, stream_copy)."""
+    cam_dir = RECORDINGS_DIR / str(camera["id"])
     cam_dir.mkdir(parents=True, exist_ok=True)
 
-    stream_url = (
-        f"http://{camera['pi_user']}:{_get_pi_pass(camera)}@"
-        f"{camera['pi_ip']}:{camera['pi_port']}/stream"
-    )
+    stream_copy = _use_stream_copy(camera)
+    if stream_copy:
+        input_args = [
+            "-i",
+            f"http://{camera['pi_user']}:{_get_pi_pass(camera)}@"
+            f"{camera['pi_ip']}:{camera['pi_port']}/stream.ts",
+        ]
+    else:
+        # MJPEG frames come from the shared stream hub over stdin, so the
+        # recorder does not open a second connection to the Pi
+        input_args = [
+            "-f", "mjpeg",
+            "-use_wallclock_as_timestamps", "1",
+            "-i", "pipe:0",
+        ]
+
+    if RECORDING_FORMAT == "ts":
+        ext, format_args = ".ts", ["-segment_format", "mpegts"]
+    elif RECORDING_FORMAT == "fmp4":
+        ext, format_args = ".mp4", [
+            "-segment_format", "mp4",
+            "-segment_format_options",
+            "movflags=+frag_keyframe+empty_moov+default_base_moof",
+        ]
+    else:
+        ext, format_args = ".mp4", []
+    output_pattern = str(cam_dir / f"seg_%Y%m%d_%H%M%S{ext}")
 
-    output_pattern = str(cam_dir / "seg_%Y%m%d_%H%M%S.mp4")
+    if stream_copy:
+        # Upstream is already H.264/H.265: remux only, no decode/encode
+        codec_args = ["-map", "0:v:0", "-c:v", "copy"]
+    else:
+        codec_args = ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "28"]
 
     cmd = [
         "ffmpeg",
         "-y",
-        "-i", stream_url,
-        "-c:v", "libx264",
-        "-preset", "ultrafast",
-        "-crf", "28",
+        "-nostats",
+        "-loglevel", "warning",
+        # Machine-readable key=value progress blocks, interleaved with log
+        # lines on stderr (stdout carries the segment list)
+        "-progress", "pipe:2",
+        *input_args,
+        *codec_args,
         "-f", "segment",
+        *format_args,
         "-segment_time", str(SEGMENT_DURATION),
         "-strftime", "1",
         "-reset_timestamps", "1",
+        # Report each finished segment on stdout for the segment index
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "csv",
         "-an",  # no audio
         output_pattern,
     ]
+    return cmd, stream_copy
+
+
+class RecordingSupervisor:
+    """Runs the FFmpeg recorder for one camera and keeps it healthy.
+
+    stderr is drained continuously (an unread pipe fills at ~64 KB and
+    silently blocks FFmpeg) and its ``-progress`` blocks are parsed. A
+    recorder whose frame count stops advancing for STALL_TIMEOUT seconds is
+    killed, and exits are retried with exponential backoff.
+    """
+
+    STALL_TIMEOUT = 60       # seconds without progress before a restart
+    BACKOFF_INITIAL = 2
+    BACKOFF_MAX = 300
+    STABLE_RUN = 120         # a run this long resets the backoff
+    PROGRESS_KEYS = {
+        "frame", "fps", "bitrate", "total_size", "out_time_us", "out_time",
+        "dup_frames", "drop_frames", "speed", "progress",
+    }
+
+    def __init__(self, cam_id):
+        self.cam_id = cam_id
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.proc = None
+        self.state = "starting"
+        self.mode = None
+        self.progress = {}
+        self.stderr_tail = collections.deque(maxlen=20)
+        self.started_at = None
+        self.last_advance = None
+        self.restarts = 0
+        self.stalls = 0
+        self.last_exit = None
+        self.backoff = self.BACKOFF_INITIAL
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive() \
+            and not self.stopping.is_set()
+
+    def stop(self, timeout=10):
+        self.stopping.set()
+        with self.lock:
+            proc = self.proc
+        if proc and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            camera = get_camera(self.cam_id)
+            if not camera or not camera["pi_ip"]:
+                break
+            camera["_plain_pass"] = _pi_passwords.get(camera["pi_user"], "")
+
+            started = time.monotonic()
+            reason = self._run_once(camera)
+            if self.stopping.is_set():
+                break
+
+            if time.monotonic() - started > self.STABLE_RUN:
+                self.backoff = self.BACKOFF_INITIAL
+            log.warning(
+                f"Recorder for camera {self.cam_id} {reason}; "
+                f"restarting in {self.backoff}s"
+            )
+            _log_event(self.cam_id, "recording_error", f"Recorder {reason}")
+            with self.lock:
+                self.state = "backoff"
+                self.restarts += 1
+            if self.stopping.wait(self.backoff):
+                break
+            self.backoff = min(self.backoff * 2, self.BACKOFF_MAX)
+
+        with self.lock:
+            self.state = "stopped"
+
+    def _run_once(self, camera):
+        """Run one FFmpeg process until it exits or stalls; returns why."""
+        cmd, stream_copy = _recording_command(camera)
+        # Pick up segments a previous FFmpeg left behind without reporting them
+        reindex_segments(self.cam_id)
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                stdin=None if stream_copy else subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            return f"failed to start ({e})"
+
+        with self.lock:
+            self.proc = proc
+            self.state = "recording"
+            self.mode = "copy" if stream_copy else "transcode"
+            self.progress = {}
+            self.started_at = time.time()
+            self.last_advance = time.monotonic()
+
+        threading.Thread(
+            target=_read_segment_list, args=(self.cam_id, proc), daemon=True
+        ).start()
+        threading.Thread(target=self._drain_stderr, args=(proc,), daemon=True).start()
+        if not stream_copy:
+            threading.Thread(
+                target=_feed_recorder, args=(get_stream_hub(self.cam_id), proc), daemon=True
+            ).start()
+
+        reason = None
+        while proc.poll() is None:
+            if self.stopping.wait(1):
+                break
+            with self.lock:
+                idle = time.monotonic() - self.last_advance
+            if idle > self.STALL_TIMEOUT:
+                reason = f"stalled (no progress for {int(idle)}s)"
+                with self.lock:
+                    self.stalls += 1
+                proc.kill()
+                break
+
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        with self.lock:
+            self.last_exit = proc.returncode
+        return reason or f"exited with code {proc.returncode}"
+
+    def _drain_stderr(self, proc):
+        block = {}
+        for raw in proc.stderr:
+            line = raw.decode(errors="replace").strip()
+            key, sep, value = line.partition("=")
+            if sep and key in self.PROGRESS_KEYS:
+                block[key] = value.strip()
+                if key == "progress":
+                    self._apply_progress(block)
+                    block = {}
+            elif line:
+                with self.lock:
+                    self.stderr_tail.append(line)
+
+    def _apply_progress(self, block):
+        with self.lock:
+            prev_frame = self.progress.get("frame")
+            prev_time = self.progress.get("out_time_us")
+            self.progress = block
+            if block.get("frame") != prev_frame or block.get("out_time_us") != prev_time:
+                self.last_advance = time.monotonic()
+
+    def status(self):
+        def number(value, cast=float):
+            try:
+                return cast(str(value).rstrip("x").replace("kbits/s", ""))
+            except (TypeError, ValueError):
+                return None
+
+        with self.lock:
+            p = self.progress
+            return {
+                "camera_id": self.cam_id,
+                "state": self.state,
+                "mode": self.mode,
+                "pid": self.proc.pid if self.proc and self.proc.poll() is None else None,
+                "started_at": self.started_at,
+                "seconds_since_progress": round(time.monotonic() - self.last_advance, 1)
+                    if self.last_advance else None,
+                "frame": number(p.get("frame"), int),
+                "fps": number(p.get("fps")),
+                "bitrate_kbps": number(p.get("bitrate")),
+                "speed": number(p.get("speed")),
+                "dropped_frames": number(p.get("drop_frames"), int),
+                "duplicated_frames": number(p.get("dup_frames"), int),
+                "restarts": self.restarts,
+                "stalls": self.stalls,
+                "last_exit_code": self.last_exit,
+                "next_backoff_s": self.backoff,
+                "stderr_tail": list(self.stderr_tail),
+            }
+
+
+def start_recording(camera):
+    """Start a supervised FFmpeg recorder for a camera."""
+    cam_id = camera["id"]
+
+    with recording_lock:
+        sup = recorders.get(cam_id)
+        if sup is not None and sup.is_alive():
+            log.info(f"Recording already active for camera {cam_id}")
+            return
+        sup = recorders[cam_id] = RecordingSupervisor(cam_id)
 
     log.info(f"Starting recording for camera {cam_id}: {camera['name']}")
+    sup.start()
+    _log_event(cam_id, "recording_start", "Recording started")
+
+
+def _feed_recorder(hub, proc):
+    """Pipe frames from a camera's stream hub into an FFmpeg recorder."""
+    hub.subscribe()
+    seq = 0
     try:
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.PIPE,
-        )
-        with recording_lock:
-            recording_processes[cam_id] = proc
+        while proc.poll() is None:
+            seq, frame = hub.wait_frame(seq, timeout=5)
+            if frame is not None:
+                proc.stdin.write(frame)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        hub.unsubscribe()
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
 
-        # Log event
-        _log_event(cam_id, "recording_start", "Recording started")
-    except Exception as e:
-        log.error(f"Failed to start recording for camera {cam_id}: {e}")
+
+def _use_stream_copy(camera):
+    """Decide between remuxing /stream.ts and transcoding /stream."""
+    mode = camera.get("recording_mode") or RECORDING_MODE
+    if mode == "copy":
+        return True
+    if mode == "transcode":
+        return False
+    return bool(camera.get("passthrough"))
 
 
 def stop_recording(camera_id):
     """Stop FFmpeg recording for a camera."""
     with recording_lock:
-        proc = recording_processes.pop(camera_id, None)
-    if proc and proc.poll() is None:
-        proc.terminate()
-        try:
-            proc.wait(timeout=10)
-        except subprocess.TimeoutExpired:
-            proc.kill()
+        sup = recorders.pop(camera_id, None)
+    if sup and sup.is_alive():
+        sup.stop()
         log.info(f"Stopped recording for camera {camera_id}")
         _log_event(camera_id, "recording_stop", "Recording stopped")
 
 
 def cleanup_old_recordings():
-    """Delete recording segments older than MAX_AGE_HOURS."""
+    """Apply the retention policy to the segment index.
+
+    Closed segments are evicted oldest-first: first anything older than
+    MAX_AGE_HOURS, then per-camera quotas, then the global MAX_DISK_GB budget
+    (merging each camera's oldest segments through a heap). At most
+    RETENTION_MAX_DELETES files go per pass; returns True if work remains.
+    """
+    budget = RETENTION_MAX_DELETES
+    victims = {}  # path -> (camera_id, bytes)
+    conn = get_db()
+
+    def oldest(cam_id, limit):
+        return conn.execute(
+            """SELECT path, camera_id, bytes, start_ts FROM segments
+               WHERE camera_id = ? AND status = 'closed'
+               ORDER BY start_ts LIMIT ?""",
+            (cam_id, limit + len(victims) + 1),
+        ).fetchall()
+
+    # 1. Age limit
     cutoff = time.time() - (MAX_AGE_HOURS * 3600)
-    count = 0
-    for cam_dir in RECORDINGS_DIR.iterdir():
+    rows = conn.execute(
+        """SELECT path, camera_id, bytes FROM segments
+           WHERE status = 'closed' AND end_ts < ? ORDER BY end_ts LIMIT ?""",
+        (cutoff, budget + 1),
+    ).fetchall()
+    more = len(rows) > budget
+    for row in rows[:budget]:
+        victims[row["path"]] = (row["camera_id"], row["bytes"])
+
+    usage = {
+        row["camera_id"]: row["used"] for row in conn.execute(
+            "SELECT camera_id, SUM(bytes) AS used FROM segments GROUP BY camera_id"
+        )
+    }
+    for cam_id, size in victims.values():
+        usage[cam_id] -= size
+
+    # 2. Per-camera quotas
+    quotas = {
+        row["id"]: row["quota_gb"] for row in
+        conn.execute("SELECT id, quota_gb FROM cameras")
+    }
+    for cam_id in list(usage):
+        quota_gb = quotas.get(cam_id) or CAMERA_QUOTA_GB
+        if not quota_gb:
+            continue
+        limit = quota_gb * 1024 ** 3
+        for row in oldest(cam_id, budget - len(victims)):
+            if usage[cam_id] <= limit:
+                break
+            if row["path"] in victims:
+                continue
+            if len(victims) >= budget:
+                more = True
+                break
+            victims[row["path"]] = (cam_id, row["bytes"])
+            usage[cam_id] -= row["bytes"]
+
+    # 3. Global budget, oldest first across all cameras
+    if MAX_DISK_GB:
+        limit = MAX_DISK_GB * 1024 ** 3
+        total = sum(usage.values())
+        if total > limit:
+            cursors = [
+                [(row["start_ts"], row["path"], cam_id, row["bytes"])
+                 for row in oldest(cam_id, budget - len(victims))]
+                for cam_id in usage
+            ]
+            for _, path, cam_id, size in heapq.merge(*cursors):
+                if total <= limit:
+                    break
+                if path in victims:
+                    continue
+                if len(victims) >= budget:
+                    more = True
+                    break
+                victims[path] = (cam_id, size)
+                total -= size
+    conn.close()
+
+    for path in victims:
+        (RECORDINGS_DIR / path).unlink(missing_ok=True)
+    forget_segments(list(victims))
+    if victims:
+        freed = sum(size for _, size in victims.values())
+        log.info(
+            f"Retention removed {len(victims)} segments "
+            f"({freed / 1024 ** 2:.0f} MB){', more pending' if more else ''}"
+        )
+    return more
+
+
+def retention_loop():
+    """Run retention passes; back-to-back while a pass hits its delete cap."""
+    while True:
+        try:
+            more = cleanup_old_recordings()
+        except Exception as e:
+            log.error(f"Retention pass failed: {e}")
+            more = False
+        time.sleep(1 if more else RETENTION_INTERVAL)
+
+# ---------------------------------------------------------------------------
+# Segment index
+# ---------------------------------------------------------------------------
+
+segment_cache = {}  # camera_id -> {filename: segment dict}, mirrors the table
+segment_cache_lock = threading.Lock()
+
+
+def _segment_start_ts(filename):
+    """Wall-clock start of a segment from its strftime name (local time)."""
+    try:
+        stem = Path(filename).stem  # seg_YYYYmmdd_HHMMSS
+        return datetime.strptime(stem[len("seg_"):], "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return None
+
+
+def _cache_segment(row):
+    entry = {key: row[key] for key in
+             ("id", "camera_id", "path", "start_ts", "end_ts", "bytes", "status")}
+    with segment_cache_lock:
+        segment_cache.setdefault(entry["camera_id"], {})[Path(entry["path"]).name] = entry
+
+
+def load_segment_cache():
+    conn = get_db()
+    rows = conn.execute("SELECT * FROM segments").fetchall()
+    conn.close()
+    with segment_cache_lock:
+        segment_cache.clear()
+    for row in rows:
+        _cache_segment(row)
+
+
+def get_cached_segments(cam_id):
+    """Segments of a camera, newest first, without touching disk or DB."""
+    with segment_cache_lock:
+        entries = list(segment_cache.get(cam_id, {}).values())
+    return sorted(entries, key=lambda e: e["start_ts"], reverse=True)
+
+
+def resolve_segments(points):
+    """Map (camera_id, epoch) pairs to (segment path, offset seconds) or None.
+
+    Uses the in-memory index only; each camera's segments are sorted once
+    per call so a batch of events costs one bisect per event.
+    """
+    starts_by_cam = {}
+    results = []
+    for cam_id, ts in points:
+        if cam_id not in starts_by_cam:
+            with segment_cache_lock:
+                entries = sorted(segment_cache.get(cam_id, {}).values(),
+                                 key=lambda e: e["start_ts"])
+            starts_by_cam[cam_id] = ([e["start_ts"] for e in entries], entries)
+        starts, entries = starts_by_cam[cam_id]
+        i = bisect.bisect_right(starts, ts) - 1
+        if i < 0:
+            results.append(None)
+            continue
+        seg = entries[i]
+        # A segment still being written has a stale end_ts; it covers
+        # everything after its start
+        if seg["status"] == "recording" or ts < (seg["end_ts"] or 0):
+            results.append((seg["path"], round(ts - seg["start_ts"], 3)))
+        else:
+            results.append(None)
+    return results
+
+
+def index_segment(cam_id, filepath, duration=None, status="closed"):
+    """Insert or update a segment row from the file on disk."""
+    filepath = Path(filepath)
+    try:
+        st = filepath.stat()
+    except FileNotFoundError:
+        return
+    start_ts = _segment_start_ts(filepath.name)
+    if start_ts is None:
+        start_ts = st.st_mtime - (duration or 0)
+    end_ts = start_ts + duration if duration is not None else st.st_mtime
+    rel_path = f"{cam_id}/{filepath.name}"
+
+    conn = get_db()
+    conn.execute(
+        """INSERT INTO segments (camera_id, path, start_ts, end_ts, bytes, status)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT(path) DO UPDATE SET
+               end_ts = excluded.end_ts, bytes = excluded.bytes, status = excluded.status""",
+        (cam_id, rel_path, start_ts, end_ts, st.st_size, status),
+    )
+    if status == "closed":
+        # Bookmark events the writer could not place at ingest: without
+        # inotify the current segment is only indexed once it closes
+        conn.execute(
+            """UPDATE events SET segment_path = ?, segment_offset = round(ts_ms / 1000.0 - ?, 3)
+               WHERE camera_id = ? AND ts_ms >= ? AND ts_ms < ? AND segment_path IS NULL""",
+            (rel_path, start_ts, cam_id, round(start_ts * 1000), round(end_ts * 1000)),
+        )
+    row = conn.execute("SELECT * FROM segments WHERE path = ?", (rel_path,)).fetchone()
+    conn.commit()
+    conn.close()
+    _cache_segment(row)
+    if status == "closed":
+        thumbnail_worker.enqueue(rel_path)
+
+
+def forget_segments(paths):
+    """Drop segment rows (relative paths) from the index and the cache."""
+    if not paths:
+        return
+    conn = get_db()
+    conn.executemany("DELETE FROM segments WHERE path = ?", [(p,) for p in paths])
+    conn.executemany(
+        "UPDATE events SET segment_path = NULL, segment_offset = NULL WHERE segment_path = ?",
+        [(p,) for p in paths],
+    )
+    conn.commit()
+    conn.close()
+    with segment_cache_lock:
+        for rel_path in paths:
+            cam_id, _, name = rel_path.partition("/")
+            segment_cache.get(int(cam_id), {}).pop(name, None)
+            _mp4_init_sizes.pop(str(RECORDINGS_DIR / rel_path), None)
+    for rel_path in paths:
+        thumbnail_worker.discard(rel_path)
+
+
+def _read_segment_list(cam_id, proc):
+    """Index each segment as FFmpeg reports it closed (CSV: name,start,end)."""
+    cam_dir = RECORDINGS_DIR / str(cam_id)
+    for line in proc.stdout:
+        parts = line.decode(errors="replace").strip().rsplit(",", 2)
+        if len(parts) != 3:
+            continue
+        name, start, end = parts
+        try:
+            duration = float(end) - float(start)
+        except ValueError:
+            duration = None
+        index_segment(cam_id, cam_dir / Path(name.strip('"')).name, duration)
+
+
+def reindex_segments(cam_id=None):
+    """Reconcile the index with the files on disk.
+
+    Runs once at startup (and per camera before its recorder starts) to pick
+    up files written while the server was down, close rows left in the
+    'recording' state and drop rows whose files are gone. Normal operation
+    never scans the recordings directory.
+    """
+    if cam_id is None:
+        cam_dirs = [d for d in RECORDINGS_DIR.iterdir() if d.is_dir() and d.name.isdigit()]
+    else:
+        cam_dirs = [RECORDINGS_DIR / str(cam_id)]
+
+    added = removed = 0
+    for cam_dir in cam_dirs:
         if not cam_dir.is_dir():
             continue
-        for seg_file in cam_dir.glob("seg_*.mp4"):
-            if seg_file.stat().st_mtime < cutoff:
-                seg_file.unlink()
-                count += 1
-    if count > 0:
-        log.info(f"Cleaned up {count} old recording segments")
+        cid = int(cam_dir.name)
+        conn = get_db()
+        known = {
+            row["path"]: row["status"] for row in
+            conn.execute("SELECT path, status FROM segments WHERE camera_id = ?", (cid,))
+        }
+        conn.close()
+        on_disk = {
+            f"{cid}/{f.name}": f for f in cam_dir.glob("seg_*")
+            if f.suffix in SEGMENT_EXTENSIONS
+        }
+        for rel_path, f in on_disk.items():
+            if known.get(rel_path) != "closed":
+                index_segment(cid, f)
+                added += rel_path not in known
+        gone = known.keys() - on_disk.keys()
+        forget_segments(list(gone))
+        removed += len(gone)
+
+    if added or removed:
+        log.info(f"Segment index: {added} added, {removed} removed")
+
+# ---------------------------------------------------------------------------
+# Recordings watcher (Linux inotify)
+# ---------------------------------------------------------------------------
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class RecordingsWatcher:
+    """Keeps the segment index current from inotify events.
+
+    Watches RECORDINGS_DIR for new camera directories and every camera
+    directory for segment files being created, finished and deleted, so each
+    new segment costs O(1) bookkeeping and no directory is ever polled.
+    """
+
+    CAMERA_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.fd = None
+        self.watches = {}  # wd -> camera_id (None for the root)
+        self._libc = None
+
+    def start(self):
+        """Begin watching; returns False where inotify is unavailable."""
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = self._libc.inotify_init1(IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+        self.fd = fd
+        self._add_watch(self.root, None, IN_CREATE | IN_MOVED_TO)
+        for cam_dir in self.root.iterdir():
+            if cam_dir.is_dir() and cam_dir.name.isdigit():
+                self._add_watch(cam_dir, int(cam_dir.name), self.CAMERA_MASK)
+        threading.Thread(target=self._run, daemon=True).start()
+        return True
+
+    def _add_watch(self, path, cam_id, mask):
+        wd = self._libc.inotify_add_watch(self.fd, str(path).encode(), mask)
+        if wd < 0:
+            log.warning(f"inotify_add_watch failed for {path}: errno {ctypes.get_errno()}")
+            return
+        self.watches[wd] = cam_id
+
+    def _run(self):
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                log.error(f"Recordings watcher stopped: {e}")
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = data[offset:offset + name_len].rstrip(b"\0").decode(errors="replace")
+                offset += name_len
+                try:
+                    self._handle(wd, mask, name)
+                except Exception as e:
+                    log.error(f"Recordings watcher error on {name}: {e}")
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        if wd not in self.watches:
+            return
+        cam_id = self.watches[wd]
+
+        if cam_id is None:
+            # A new camera directory under RECORDINGS_DIR
+            if mask & IN_ISDIR and name.isdigit():
+                cam_dir = self.root / name
+                self._add_watch(cam_dir, int(name), self.CAMERA_MASK)
+                reindex_segments(int(name))  # files created before the watch
+            return
+
+        if not name.startswith("seg_") or not name.endswith(SEGMENT_EXTENSIONS) \
+           or mask & IN_ISDIR:
+            return
+        path = self.root / str(cam_id) / name
+        if mask & IN_CREATE:
+            index_segment(cam_id, path, status="recording")
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            index_segment(cam_id, path)
+        elif mask & IN_DELETE:
+            forget_segments([f"{cam_id}/{name}"])
+
+
+recordings_watcher = RecordingsWatcher(DEFAULT_RECORDINGS_DIR)
 
 
 def _get_pi_pass(camera):
     """Retrieve plain password. In production use proper secret management."""
-    conn = get_db()
-    row = conn.execute(
-        "SELECT pi_pass_hash FROM cameras WHERE id = ?", (camera["id"],)
-    ).fetchone()
-    conn.close()
     # We store the actual password for Pi communication (hashed for display only)
     # In a real system you'd use a vault or encrypted storage
-    return camera.get("_plain_pass", "")
+    return camera.get("_plain_pass") or _pi_passwords.get(camera["pi_user"], "")
 
 
 # We keep a runtime cache of plain passwords for Pi communication
@@ -233,62 +1393,615 @@ _pi_passwords = {}  # pi_user -> plain password
 
 
 def _log_event(camera_id, event_type, message):
-    conn = get_db()
-    conn.execute(
-        "INSERT INTO events (camera_id, event_type, message, timestamp) VALUES (?, ?, ?, ?)",
-        (camera_id, event_type, message, datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-    conn.close()
+    timestamp = datetime.utcnow().isoformat()
+    event_writer.put((camera_id, event_type, message, timestamp))
+    event_bus.publish("event", {
+        "camera_id": camera_id,
+        "event_type": event_type,
+        "message": message,
+        "timestamp": timestamp,
+    })
+
+# ---------------------------------------------------------------------------
+# Scrubbing thumbnails
+# ---------------------------------------------------------------------------
+
+THUMB_INTERVAL = 10   # seconds between thumbnails
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 90
+THUMB_COLUMNS = 10
+
+
+def thumbnail_paths(rel_path):
+    """(sprite.jpg, index.vtt) for a segment, in <camera dir>/thumbs/."""
+    seg = RECORDINGS_DIR / rel_path
+    thumbs = seg.parent / "thumbs"
+    return thumbs / f"{seg.stem}.jpg", thumbs / f"{seg.stem}.vtt"
+
+
+class ThumbnailWorker:
+    """Builds a keyframe sprite sheet plus WebVTT index per closed segment.
+
+    FFmpeg runs with ``-skip_frame nokey`` so only keyframes are decoded,
+    and the selected frames are tiled into one JPEG; a segment costs a few
+    KB of extra storage and a small fraction of a full decode.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.ready = set()  # rel paths of segments with thumbnails
+
+    def start(self):
+        # One scan at startup; afterwards the set is maintained in memory
+        for cam_dir in RECORDINGS_DIR.iterdir():
+            if not (cam_dir.is_dir() and cam_dir.name.isdigit()):
+                continue
+            stems = {f.stem for f in (cam_dir / "thumbs").glob("*.vtt")}
+            with segment_cache_lock:
+                names = list(segment_cache.get(int(cam_dir.name), {}))
+            with self.lock:
+                self.ready.update(
+                    f"{cam_dir.name}/{name}" for name in names if Path(name).stem in stems
+                )
+        for cam_id in list(segment_cache):
+            for entry in get_cached_segments(cam_id):
+                if entry["status"] == "closed":
+                    self.enqueue(entry["path"])
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def enqueue(self, rel_path):
+        with self.lock:
+            if rel_path in self.ready or rel_path in self.pending:
+                return
+            self.pending.add(rel_path)
+        self.queue.put(rel_path)
+
+    def discard(self, rel_path):
+        with self.lock:
+            self.ready.discard(rel_path)
+        for path in thumbnail_paths(rel_path):
+            path.unlink(missing_ok=True)
+
+    def has_thumbnails(self, rel_path):
+        with self.lock:
+            return rel_path in self.ready
+
+    def _run(self):
+        while True:
+            rel_path = self.queue.get()
+            try:
+                if self._build(rel_path):
+                    with self.lock:
+                        self.ready.add(rel_path)
+            except Exception as e:
+                log.warning(f"Thumbnail generation failed for {rel_path}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(rel_path)
+
+    def _build(self, rel_path):
+        cam_id, _, filename = rel_path.partition("/")
+        with segment_cache_lock:
+            entry = segment_cache.get(int(cam_id), {}).get(filename)
+        seg = RECORDINGS_DIR / rel_path
+        if entry is None or not seg.exists():
+            return False
+        sprite, vtt = thumbnail_paths(rel_path)
+        if vtt.exists() and vtt.stat().st_mtime >= seg.stat().st_mtime:
+            return True  # already built (e.g. queued again during startup)
+        sprite.parent.mkdir(exist_ok=True)
+
+        duration = max(entry["end_ts"] - entry["start_ts"], THUMB_INTERVAL)
+        count = math.ceil(duration / THUMB_INTERVAL)
+        rows = math.ceil(count / THUMB_COLUMNS)
+        cmd = [
+            "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+            "-skip_frame", "nokey",
+            "-i", str(seg),
+            # fps= resamples the keyframes onto an exact THUMB_INTERVAL grid
+            # (nearest keyframe, repeated if the GOP is longer), so tile i
+            # always matches the cue for i * THUMB_INTERVAL
+            "-vf", f"fps=1/{THUMB_INTERVAL},scale={THUMB_WIDTH}:{THUMB_HEIGHT},"
+                   f"tile={THUMB_COLUMNS}x{rows}",
+            "-vsync", "vfr",
+            "-frames:v", "1",
+            "-q:v", "5",
+            str(sprite),
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                timeout=120)
+        if result.returncode != 0 or not sprite.exists():
+            raise RuntimeError(result.stderr.decode(errors="replace").strip()[-300:])
+
+        sprite_url = f"/api/cameras/{cam_id}/recordings/{filename}/sprite.jpg"
+        cues = ["WEBVTT", ""]
+        for i in range(count):
+            start, end = i * THUMB_INTERVAL, min((i + 1) * THUMB_INTERVAL, duration)
+            x, y = (i % THUMB_COLUMNS) * THUMB_WIDTH, (i // THUMB_COLUMNS) * THUMB_HEIGHT
+            cues += [
+                f"{_vtt_time(start)} --> {_vtt_time(end)}",
+                f"{sprite_url}#xywh={x},{y},{THUMB_WIDTH},{THUMB_HEIGHT}",
+                "",
+            ]
+        vtt.write_text("\n".join(cues))
+        return True
+
+
+def _vtt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+thumbnail_worker = ThumbnailWorker()
+
+# ---------------------------------------------------------------------------
+# Batched event writer
+# ---------------------------------------------------------------------------
+
+EVENT_BATCH_INTERVAL = 0.1  # seconds to gather a batch
+EVENT_BATCH_SIZE = 500      # rows per commit at most
+EVENT_QUEUE_SIZE = 10000    # pending events before producers start dropping
+
+
+class EventWriter:
+    """Group-commits events from a bounded queue on a single writer thread.
+
+    Event bursts (many Pis reporting motion at once) cost one INSERT batch and
+    one WAL commit per interval instead of a commit per event.
+    """
+
+    def __init__(self, batch_interval=EVENT_BATCH_INTERVAL,
+                 batch_size=EVENT_BATCH_SIZE, max_queue=EVENT_QUEUE_SIZE):
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.events_written = 0
+        self.events_dropped = 0
+        self.batches_committed = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self._total_commit_ms = 0.0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        try:
+            self.queue.put(row, timeout=1)
+        except queue.Full:
+            with self.lock:
+                self.events_dropped += 1
+            log.warning(f"Event queue full, dropped event {row[1]} for camera {row[0]}")
+
+    def flush(self, timeout=10):
+        """Block until everything queued so far has been committed."""
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self):
+        if self.flush():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch, markers, stopping = [], [], False
+            deadline = time.monotonic() + self.batch_interval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    # Flush request: commit what we have right away
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+            for marker in markers:
+                marker.set()
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        start = time.monotonic()
+        rows = self._bookmark(batch)
+        hourly = collections.Counter(
+            (row[0], row[1], row[4] // 3600000 * 3600) for row in rows if row[0] is not None
+        )
+        conn = get_db()
+        try:
+            conn.executemany(
+                """INSERT INTO events (camera_id, event_type, message, timestamp,
+                                       ts_ms, segment_path, segment_offset)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            # Same transaction, so rollups never drift from the raw rows
+            conn.executemany(
+                """INSERT INTO event_rollups (camera_id, event_type, hour_ts, count)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (event_type, hour_ts, camera_id)
+                   DO UPDATE SET count = count + excluded.count""",
+                [key + (n,) for key, n in hourly.items()],
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            log.error(f"Failed to write {len(batch)} events: {e}")
+            with self.lock:
+                self.events_dropped += len(batch)
+            return
+        finally:
+            conn.close()
+        elapsed_ms = (time.monotonic() - start) * 1000
+        with self.lock:
+            self.events_written += len(batch)
+            self.batches_committed += 1
+            self.last_commit_ms = elapsed_ms
+            self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+            self._total_commit_ms += elapsed_ms
+
+    @staticmethod
+    def _bookmark(batch):
+        """Attach epoch ms and the recorded segment/offset each event falls into."""
+        points = [(row[0], parse_timestamp(row[3])) for row in batch]
+        rows = []
+        for row, (_, ts), hit in zip(batch, points, resolve_segments(points)):
+            rows.append(tuple(row) + (round(ts * 1000),) + (hit or (None, None)))
+        return rows
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "events_written": self.events_written,
+                "events_dropped": self.events_dropped,
+                "batches_committed": self.batches_committed,
+                "last_commit_ms": round(self.last_commit_ms, 2),
+                "max_commit_ms": round(self.max_commit_ms, 2),
+                "avg_commit_ms": round(
+                    self._total_commit_ms / self.batches_committed, 2
+                ) if self.batches_committed else 0.0,
+            }
+
+
+event_writer = EventWriter()
+
+# ---------------------------------------------------------------------------
+# Live event bus (Server-Sent Events)
+# ---------------------------------------------------------------------------
+
+EVENT_BUS_QUEUE_SIZE = 256   # messages buffered per subscriber
+SSE_KEEPALIVE = 15           # seconds between keep-alive comments
+
+
+class EventBus:
+    """In-process pub/sub fan-out to SSE clients.
+
+    Each subscriber gets its own bounded queue; a client that stops reading
+    loses messages instead of stalling publishers. Idle subscribers cost no
+    DB queries at all.
+    """
+
+    def __init__(self, max_queue=EVENT_BUS_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, kind, data):
+        message = (kind, json.dumps(data))  # serialize once for all clients
+        with self.lock:
+            self.published += 1
+            for q in self.subscribers:
+                try:
+                    q.put_nowait(message)
+                except queue.Full:
+                    self.dropped += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "subscribers": len(self.subscribers),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
+
+
+event_bus = EventBus()
+
+
+def _publish_camera(cam):
+    """Push a camera's current state to dashboards (without secrets)."""
+    if cam:
+        event_bus.publish("camera", {
+            k: v for k, v in cam.items() if k != "pi_pass_hash" and not k.startswith("_")
+        })
 
 # ---------------------------------------------------------------------------
 # Background tasks
 # ---------------------------------------------------------------------------
 
+_health_pool = ThreadPoolExecutor(
+    max_workers=HEALTH_CHECK_WORKERS, thread_name_prefix="health"
+)
+_health_local = threading.local()  # keep-alive session per probe thread
+
+health_metrics = {
+    "cycles": 0,
+    "last_cycle_s": 0.0,
+    "max_cycle_s": 0.0,
+    "online": 0,
+    "offline": 0,
+}
+health_metrics_lock = threading.Lock()
+
+
+def _probe_camera(cam):
+    """Return the Pi's /status payload, or None if it did not answer."""
+    session = getattr(_health_local, "session", None)
+    if session is None:
+        session = _health_local.session = requests.Session()
+    pi_pass = _pi_passwords.get(cam["pi_user"], "")
+    try:
+        r = session.get(
+            f"http://{cam['pi_ip']}:{cam['pi_port']}/status",
+            auth=(cam["pi_user"], pi_pass),
+            timeout=HEALTH_CHECK_TIMEOUT,
+        )
+        if r.status_code != 200:
+            return None
+        try:
+            return r.json()
+        except ValueError:
+            return {}
+    except Exception:
+        return None
+
+
 def health_check_loop():
     """Periodically check if Pi cameras are online."""
     while True:
         time.sleep(HEALTH_CHECK_INTERVAL)
-        cameras = get_all_cameras()
+        started = time.monotonic()
+        cameras = [cam for cam in get_all_cameras() if cam["pi_ip"]]
+
+        # Probe all Pis at once so a cycle takes about one timeout
+        statuses = list(_health_pool.map(_probe_camera, cameras))
+
+        now = datetime.utcnow().isoformat()
+        online = [(cam, st) for cam, st in zip(cameras, statuses) if st is not None]
+        offline = [cam for cam, st in zip(cameras, statuses) if st is None]
+        changed = [cam for cam, _ in online if not cam["is_online"]] + \
+                  [cam for cam in offline if cam["is_online"]]
+
         conn = get_db()
-        for cam in cameras:
-            if not cam["pi_ip"]:
-                continue
-            pi_pass = _pi_passwords.get(cam["pi_user"], "")
-            try:
-                r = requests.get(
-                    f"http://{cam['pi_ip']}:{cam['pi_port']}/status",
-                    auth=(cam["pi_user"], pi_pass),
-                    timeout=5,
-                )
-                if r.status_code == 200:
-                    conn.execute(
-                        "UPDATE cameras SET is_online = 1, last_seen = ? WHERE id = ?",
-                        (datetime.utcnow().isoformat(), cam["id"]),
-                    )
-                    # Ensure recording is running
-                    with recording_lock:
-                        if cam["id"] not in recording_processes or \
-                           recording_processes[cam["id"]].poll() is not None:
-                            cam["_plain_pass"] = pi_pass
-                            threading.Thread(
-                                target=start_recording, args=(cam,), daemon=True
-                            ).start()
-                else:
-                    conn.execute("UPDATE cameras SET is_online = 0 WHERE id = ?", (cam["id"],))
-            except Exception:
-                conn.execute("UPDATE cameras SET is_online = 0 WHERE id = ?", (cam["id"],))
+        conn.executemany(
+            "UPDATE cameras SET is_online = 1, last_seen = ?, passthrough = ? WHERE id = ?",
+            [(now, 1 if st.get("passthrough") else 0, cam["id"]) for cam, st in online],
+        )
+        conn.executemany(
+            "UPDATE cameras SET is_online = 0 WHERE id = ?",
+            [(cam["id"],) for cam in offline],
+        )
         conn.commit()
         conn.close()
 
-        # Clean old recordings every cycle
-        cleanup_old_recordings()
+        for cam in changed:
+            cam["is_online"] = 0 if cam["is_online"] else 1
+            if cam["is_online"]:
+                cam["last_seen"] = now
+            _publish_camera(cam)
+
+        # Ensure recording is running (supervisors handle their own restarts)
+        for cam, _ in online:
+            with recording_lock:
+                sup = recorders.get(cam["id"])
+            if sup is None or not sup.is_alive():
+                start_recording(cam)
+
+        elapsed = time.monotonic() - started
+        with health_metrics_lock:
+            health_metrics["cycles"] += 1
+            health_metrics["last_cycle_s"] = round(elapsed, 3)
+            health_metrics["max_cycle_s"] = max(health_metrics["max_cycle_s"], round(elapsed, 3))
+            health_metrics["online"] = len(online)
+            health_metrics["offline"] = len(offline)
 
 
 def start_background_tasks():
+    event_writer.start()
+    atexit.register(event_writer.stop)
     threading.Thread(target=health_check_loop, daemon=True).start()
+    threading.Thread(target=retention_loop, daemon=True).start()
     log.info("Background tasks started")
 
+# ---------------------------------------------------------------------------
+# Clip export
+# ---------------------------------------------------------------------------
+
+class ExportNotReady(Exception):
+    """The range needs a segment that cannot be read until it closes."""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class ExportJob:
+    """One clip export: covering segments concatenated and trimmed with -c copy."""
+
+    def __init__(self, cam_id, from_ts, to_ts, filename):
+        self.id = uuid.uuid4().hex[:12]
+        self.cam_id = cam_id
+        self.from_ts = from_ts
+        self.to_ts = to_ts
+        self.filename = filename
+        self.status = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def path(self):
+        return EXPORTS_DIR / self.filename
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "camera_id": self.cam_id,
+            "from": self.from_ts,
+            "to": self.to_ts,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "url": f"/api/exports/{self.id}/file" if self.status == "done" else None,
+        }
+
+
+export_jobs = {}  # job id -> ExportJob
+export_lock = threading.Lock()
+_export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+
+def submit_export(cam_id, from_ts, to_ts):
+    """Queue an export, or finish it at once if the same clip is cached.
+
+    Segments still being recorded are exported as far as they are written
+    (fragmented MP4 and MPEG-TS stay readable). A plain MP4 has no index
+    until it closes, so a range needing one raises ExportNotReady.
+    """
+    rows = _covering_segments(cam_id, from_ts, to_ts)
+    if not rows:
+        return None
+    for row in rows:
+        path = RECORDINGS_DIR / row["path"]
+        if row["status"] == "recording" and path.suffix == ".mp4" \
+                and _mp4_init_size(path) is None:
+            raise ExportNotReady(max(1, math.ceil(row["start_ts"] + SEGMENT_DURATION - time.time())))
+    # The key covers the exact source files, so a window whose segments
+    # changed (e.g. the newest one grew) is exported again
+    key = hashlib.sha1(repr(
+        (cam_id, from_ts, to_ts, [(row["path"], row["bytes"]) for row in rows])
+    ).encode()).hexdigest()[:12]
+    filename = f"cam{cam_id}_{int(from_ts)}_{int(to_ts)}_{key}.mp4"
+    job = ExportJob(cam_id, from_ts, to_ts, filename)
+
+    with export_lock:
+        cutoff = time.time() - 86400
+        for old_id in [j.id for j in export_jobs.values() if j.finished and j.finished < cutoff]:
+            del export_jobs[old_id]
+        export_jobs[job.id] = job
+
+    if job.path.exists():
+        os.utime(job.path)  # LRU touch
+        job.status, job.progress, job.finished = "done", 1.0, time.time()
+    else:
+        _export_pool.submit(_run_export, job, rows)
+    return job
+
+
+def _run_export(job, rows):
+    job.status = "running"
+    EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    list_path = EXPORTS_DIR / f".{job.id}.txt"
+    tmp_path = EXPORTS_DIR / f".{job.id}.tmp.mp4"
+
+    lines = []
+    for i, row in enumerate(rows):
+        src = str(RECORDINGS_DIR / row["path"]).replace("'", "'\\''")
+        lines.append(f"file '{src}'")
+        if i == 0 and job.from_ts > row["start_ts"]:
+            lines.append(f"inpoint {job.from_ts - row['start_ts']:.3f}")
+        if i == len(rows) - 1 and job.to_ts < row["end_ts"]:
+            lines.append(f"outpoint {job.to_ts - row['start_ts']:.3f}")
+    list_path.write_text("\n".join(lines) + "\n")
+
+    cmd = [
+        "ffmpeg", "-y", "-nostats", "-loglevel", "error",
+        "-progress", "pipe:1",
+        "-f", "concat", "-safe", "0", "-i", str(list_path),
+        "-map", "0:v", "-c", "copy",
+        "-movflags", "+faststart",
+        str(tmp_path),
+    ]
+    total = job.to_ts - max(job.from_ts, rows[0]["start_ts"])
+    try:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+        )
+        # stderr is small at -loglevel error; read it on a thread so it cannot fill
+        stderr = []
+        drain = threading.Thread(target=lambda: stderr.extend(proc.stderr), daemon=True)
+        drain.start()
+        for raw in proc.stdout:
+            key, _, value = raw.decode(errors="replace").strip().partition("=")
+            if key == "out_time_us" and value.isdigit() and total > 0:
+                job.progress = min(int(value) / 1e6 / total, 0.99)
+        proc.wait()
+        drain.join(timeout=5)
+        if proc.returncode != 0:
+            raise RuntimeError(b"".join(stderr).decode(errors="replace").strip()[-500:]
+                               or f"ffmpeg exited with {proc.returncode}")
+        tmp_path.replace(job.path)
+        job.status, job.progress = "done", 1.0
+        log.info(f"Export {job.id} finished: {job.filename}")
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+        tmp_path.unlink(missing_ok=True)
+        log.error(f"Export {job.id} failed: {e}")
+    finally:
+        job.finished = time.time()
+        list_path.unlink(missing_ok=True)
+    _evict_exports(keep=job.path)
+
+
+def _evict_exports(keep=None):
+    """Trim the export cache to EXPORT_CACHE_GB, least recently used first."""
+    files = [(f.stat().st_mtime, f.stat().st_size, f)
+             for f in EXPORTS_DIR.glob("cam*.mp4")]
+    total = sum(size for _, size, _ in files)
+    limit = EXPORT_CACHE_GB * 1024 ** 3
+    for _, size, f in sorted(files):
+        if total <= limit:
+            break
+        if f == keep:
+            continue
+        f.unlink(missing_ok=True)
+        total -= size
+
 # ---------------------------------------------------------------------------
 # API endpoints
 # ---------------------------------------------------------------------------
@@ -302,6 +2015,7 @@ def api_register():
     pi_ip = data.get("pi_ip")
     pi_port = data.get("pi_port", 8554)
     camera_model = data.get("camera_model", "")
+    passthrough = 1 if data.get("passthrough") else 0
 
     if not pi_user or not pi_pass:
         return jsonify({"error": "pi_user and pi_pass required"}), 400
@@ -315,18 +2029,19 @@ def api_register():
         # Update existing camera
         conn.execute(
             """UPDATE cameras SET pi_ip = ?, pi_port = ?, camera_model = ?,
-               is_online = 1, last_seen = ? WHERE pi_user = ?""",
-            (pi_ip, pi_port, camera_model, datetime.utcnow().isoformat(), pi_user),
+               passthrough = ?, is_online = 1, last_seen = ? WHERE pi_user = ?""",
+            (pi_ip, pi_port, camera_model, passthrough,
+             datetime.utcnow().isoformat(), pi_user),
         )
         cam_id = existing["id"]
     else:
         # New camera — auto-register with pi_user as default name
         cursor = conn.execute(
             """INSERT INTO cameras (name, pi_user, pi_pass_hash, pi_ip, pi_port, camera_model,
-               is_online, last_seen)
-               VALUES (?, ?, ?, ?, ?, ?, 1, ?)""",
+               passthrough, is_online, last_seen)
+               VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)""",
             (pi_user, pi_user, hash_password(pi_pass), pi_ip, pi_port, camera_model,
-             datetime.utcnow().isoformat()),
+             passthrough, datetime.utcnow().isoformat()),
         )
         cam_id = cursor.lastrowid
 
@@ -338,6 +2053,7 @@ def api_register():
 
     # Start recording
     cam = get_camera(cam_id)
+    _publish_camera(cam)
     if cam:
         cam["_plain_pass"] = pi_pass
         threading.Thread(target=start_recording, args=(cam,), daemon=True).start()
@@ -354,6 +2070,19 @@ def api_cameras():
     return jsonify(get_all_cameras())
 
 
+def _parse_quota(value):
+    """Per-camera storage quota in GB; empty means use the server default."""
+    if value in (None, ""):
+        return None
+    try:
+        quota = float(value)
+    except TypeError:  # lists/objects from JSON
+        raise ValueError(value) from None
+    if not (math.isfinite(quota) and quota > 0):
+        raise ValueError(value)
+    return quota
+
+
 @app.route("/api/cameras", methods=["POST"])
 def api_add_camera():
     """Manually add a camera."""
@@ -363,16 +2092,25 @@ def api_add_camera():
     pi_pass = data.get("pi_pass")
     pi_ip = data.get("pi_ip", "")
     pi_port = data.get("pi_port", 8554)
+    recording_mode = data.get("recording_mode") or None
 
     if not pi_user or not pi_pass:
         return jsonify({"error": "pi_user and pi_pass required"}), 400
+    if recording_mode not in (None, *RECORDING_MODES):
+        return jsonify({"error": f"recording_mode must be one of {RECORDING_MODES}"}), 400
+    try:
+        quota_gb = _parse_quota(data.get("quota_gb"))
+    except ValueError:
+        return jsonify({"error": "quota_gb must be a positive number"}), 400
 
     conn = get_db()
     try:
         cursor = conn.execute(
-            """INSERT INTO cameras (name, pi_user, pi_pass_hash, pi_ip, pi_port)
-               VALUES (?, ?, ?, ?, ?)""",
-            (name, pi_user, hash_password(pi_pass), pi_ip, pi_port),
+            """INSERT INTO cameras (name, pi_user, pi_pass_hash, pi_ip, pi_port,
+               recording_mode, quota_gb)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (name, pi_user, hash_password(pi_pass), pi_ip, pi_port,
+             recording_mode, quota_gb),
         )
         conn.commit()
         cam_id = cursor.lastrowid
@@ -382,6 +2120,7 @@ def api_add_camera():
     conn.close()
 
     _pi_passwords[pi_user] = pi_pass
+    _publish_camera(get_camera(cam_id))
     return jsonify({"status": "ok", "camera_id": cam_id})
 
 
@@ -398,10 +2137,20 @@ def api_update_camera(cam_id):
     name = data.get("name", cam["name"])
     pi_ip = data.get("pi_ip", cam["pi_ip"])
     pi_port = data.get("pi_port", cam["pi_port"])
+    recording_mode = data.get("recording_mode", cam["recording_mode"]) or None
+    if recording_mode not in (None, *RECORDING_MODES):
+        conn.close()
+        return jsonify({"error": f"recording_mode must be one of {RECORDING_MODES}"}), 400
+    try:
+        quota_gb = _parse_quota(data.get("quota_gb", cam["quota_gb"]))
+    except ValueError:
+        conn.close()
+        return jsonify({"error": "quota_gb must be a positive number"}), 400
 
     conn.execute(
-        "UPDATE cameras SET name = ?, pi_ip = ?, pi_port = ? WHERE id = ?",
-        (name, pi_ip, pi_port, cam_id),
+        """UPDATE cameras SET name = ?, pi_ip = ?, pi_port = ?, recording_mode = ?,
+           quota_gb = ? WHERE id = ?""",
+        (name, pi_ip, pi_port, recording_mode, quota_gb, cam_id),
     )
 
     if "pi_pass" in data:
@@ -413,6 +2162,16 @@ def api_update_camera(cam_id):
 
     conn.commit()
     conn.close()
+    _publish_camera(get_camera(cam_id))
+
+    # Restart the recorder so a new recording mode takes effect
+    if recording_mode != cam["recording_mode"]:
+        with recording_lock:
+            was_recording = cam_id in recorders
+        if was_recording:
+            stop_recording(cam_id)
+            start_recording(get_camera(cam_id))
+
     return jsonify({"status": "ok"})
 
 
@@ -420,11 +2179,20 @@ def api_update_camera(cam_id):
 def api_delete_camera(cam_id):
     """Remove a camera."""
     stop_recording(cam_id)
+    with stream_hubs_lock:
+        for key in [k for k in stream_hubs if k[0] == cam_id]:
+            stream_hubs.pop(key).close()
+    event_writer.flush()
     conn = get_db()
     conn.execute("DELETE FROM events WHERE camera_id = ?", (cam_id,))
+    conn.execute("DELETE FROM event_rollups WHERE camera_id = ?", (cam_id,))
+    conn.execute("DELETE FROM segments WHERE camera_id = ?", (cam_id,))
     conn.execute("DELETE FROM cameras WHERE id = ?", (cam_id,))
     conn.commit()
     conn.close()
+    with segment_cache_lock:
+        segment_cache.pop(cam_id, None)
+    event_bus.publish("camera_removed", {"id": cam_id})
 
     # Clean up recordings
     cam_dir = RECORDINGS_DIR / str(cam_id)
@@ -437,27 +2205,86 @@ def api_delete_camera(cam_id):
 
 @app.route("/api/cameras/<int:cam_id>/stream")
 def api_camera_stream(cam_id):
-    """Proxy the live MJPEG stream from a Pi camera."""
+    """Proxy the live MJPEG stream from a Pi camera.
+
+    Optional ``?fps=`` caps the frame rate for this viewer (e.g. mobile).
+    ``?width=`` and ``?quality=`` select a downscaled variant made on the Pi
+    (grid tiles); without them the stream is full resolution.
+    """
     cam = get_camera(cam_id)
     if not cam or not cam["pi_ip"]:
         abort(404)
 
-    pi_pass = _pi_passwords.get(cam["pi_user"], "")
+    max_fps = request.args.get("fps", type=float)
+    if max_fps is not None:
+        if not math.isfinite(max_fps):
+            return jsonify({"error": "fps must be a number"}), 400
+        max_fps = min(max(max_fps, 0.1), 30.0)
+    width = request.args.get("width", type=int)
+    quality = request.args.get("quality", type=int)
+    if quality is not None:
+        quality = min(max(quality, 10), 95)
+
+    # All viewers of a variant share one upstream connection through its hub
+    hub = get_stream_hub(cam_id, width, quality)
+    return Response(
+        hub.frames(max_fps=max_fps),
+        mimetype="multipart/x-mixed-replace; boundary=frame",
+    )
 
-    def proxy_stream():
-        try:
-            r = requests.get(
-                f"http://{cam['pi_ip']}:{cam['pi_port']}/stream",
-                auth=(cam["pi_user"], pi_pass),
-                stream=True,
-                timeout=30,
-            )
-            for chunk in r.iter_content(chunk_size=4096):
-                yield chunk
-        except Exception as e:
-            log.error(f"Stream proxy error for camera {cam_id}: {e}")
 
-    return Response(proxy_stream(), mimetype="multipart/x-mixed-replace; boundary=frame")
+@app.route("/api/mosaic")
+def api_mosaic():
+    """One MJPEG stream with several cameras tiled in a grid.
+
+    ``cams`` is a comma-separated list of camera ids (default: all online
+    cameras), ``layout`` is ``<cols>x<rows>`` (default: smallest square that
+    fits) and ``fps`` is the composite frame rate.
+    """
+    if cv2 is None:
+        return jsonify({"error": "Mosaic requires opencv-python and numpy"}), 501
+    try:
+        if request.args.get("cams"):
+            cam_ids = [int(c) for c in request.args["cams"].split(",") if c.strip()]
+        else:
+            cam_ids = [c["id"] for c in get_all_cameras() if c["is_online"] and c["pi_ip"]]
+        layout = request.args.get("layout")
+        if layout:
+            cols, rows = (int(n) for n in layout.lower().split("x"))
+        else:
+            cols = max(1, math.ceil(math.sqrt(len(cam_ids))))
+            rows = max(1, math.ceil(len(cam_ids) / cols))
+        fps = float(request.args.get("fps", MOSAIC_DEFAULT_FPS))
+        if not math.isfinite(fps):
+            raise ValueError(fps)
+    except ValueError:
+        return jsonify({"error": "cams must be ids, layout <cols>x<rows>, fps a number"}), 400
+    if not cam_ids:
+        return jsonify({"error": "No cameras to show"}), 404
+    if cols < 1 or rows < 1 or cols * rows > MOSAIC_MAX_TILES or len(cam_ids) > cols * rows:
+        return jsonify({"error": f"layout must fit all cameras, at most {MOSAIC_MAX_TILES} tiles"}), 400
+    fps = min(max(fps, 0.5), MOSAIC_MAX_FPS)
+
+    hub = get_mosaic_hub(cam_ids, cols, rows, fps)
+    return Response(
+        hub.frames(),
+        mimetype="multipart/x-mixed-replace; boundary=frame",
+    )
+
+
+@app.route("/api/cameras/<int:cam_id>/stream/stats")
+def api_camera_stream_stats(cam_id):
+    """Viewer and frame-drop counters for a camera's live stream hubs.
+
+    The top level describes the full-resolution stream; ``variants`` lists
+    every hub (including downscaled ones) for the camera.
+    """
+    with stream_hubs_lock:
+        hubs = [hub for key, hub in stream_hubs.items() if key[0] == cam_id]
+    variants = [hub.stats() for hub in hubs]
+    full = next((v for v in variants if v["width"] is None and v["quality"] is None),
+                {"camera_id": cam_id, "upstream_open": False, "viewers": 0})
+    return jsonify({**full, "variants": variants})
 
 
 @app.route("/api/cameras/<int:cam_id>/snapshot")
@@ -504,39 +2331,266 @@ def api_camera_zoom(cam_id):
 @app.route("/api/cameras/<int:cam_id>/recordings")
 def api_camera_recordings(cam_id):
     """List available recording segments for a camera."""
-    cam_dir = RECORDINGS_DIR / str(cam_id)
-    if not cam_dir.exists():
-        return jsonify([])
-
     segments = []
-    for f in sorted(cam_dir.glob("seg_*.mp4"), reverse=True):
-        stat = f.stat()
+    for row in get_cached_segments(cam_id):
+        filename = Path(row["path"]).name
         segments.append({
-            "filename": f.name,
-            "size_mb": round(stat.st_size / (1024 * 1024), 1),
-            "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            "url": f"/api/cameras/{cam_id}/recordings/{f.name}",
+            "filename": filename,
+            "size_mb": round(row["bytes"] / (1024 * 1024), 1),
+            "modified": datetime.fromtimestamp(row["end_ts"]).isoformat(),
+            "start_ts": row["start_ts"],
+            "end_ts": row["end_ts"],
+            "status": row["status"],
+            "url": f"/api/cameras/{cam_id}/recordings/{filename}",
+            "thumbnails_url": f"/api/cameras/{cam_id}/recordings/{filename}/thumbnails.vtt"
+                if thumbnail_worker.has_thumbnails(row["path"]) else None,
         })
 
     return jsonify(segments)
 
 
+@app.route("/api/cameras/<int:cam_id>/recordings/<filename>/thumbnails.vtt")
+def api_camera_recording_thumbnails(cam_id, filename):
+    """WebVTT index mapping segment time ranges to sprite tiles."""
+    vtt = thumbnail_paths(f"{cam_id}/{filename}")[1]
+    if not vtt.exists():
+        abort(404)
+    return send_file(vtt, mimetype="text/vtt", max_age=3600)
+
+
+@app.route("/api/cameras/<int:cam_id>/recordings/<filename>/sprite.jpg")
+def api_camera_recording_sprite(cam_id, filename):
+    """Keyframe thumbnail sprite sheet for a segment."""
+    sprite = thumbnail_paths(f"{cam_id}/{filename}")[0]
+    if not sprite.exists():
+        abort(404)
+    return send_file(sprite, mimetype="image/jpeg", max_age=3600)
+
+
+def parse_timestamp(value):
+    """Epoch seconds or ISO 8601 (naive = UTC, like event timestamps) -> epoch."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+_mp4_init_sizes = {}  # path -> bytes before the first moof (None = not fragmented)
+
+
+def _mp4_init_size(filepath):
+    """Length of the ftyp+moov header of a fragmented MP4, from box headers."""
+    key = str(filepath)
+    if key in _mp4_init_sizes:
+        return _mp4_init_sizes[key]
+    result = None
+    with open(filepath, "rb") as f:
+        offset = 0
+        while True:
+            f.seek(offset)
+            header = f.read(16)
+            if len(header) < 8:
+                break
+            size, box = struct.unpack(">I4s", header[:8])
+            if size == 1 and len(header) == 16:
+                size = struct.unpack(">Q", header[8:16])[0]
+            if box == b"moof":
+                result = offset
+                break
+            if box == b"mdat" or size < 8:
+                break  # plain MP4: media data before any fragment
+            offset += size
+    if result is not None:
+        _mp4_init_sizes[key] = result
+    return result
+
+
+def _covering_segments(cam_id, from_ts, to_ts):
+    """Segment dicts overlapping [from_ts, to_ts), oldest first.
+
+    A segment still being recorded covers everything after its start (its
+    stored end_ts/bytes date from when it was created); its end and size
+    are taken from the file as it is now.
+    """
+    conn = get_db()
+    rows = conn.execute(
+        """SELECT path, start_ts, end_ts, bytes, status FROM segments
+           WHERE camera_id = ? AND start_ts < ? AND start_ts > ?
+             AND (status = 'recording' OR end_ts > ?)
+           ORDER BY start_ts""",
+        # Segments cannot start much earlier than SEGMENT_DURATION before
+        # from_ts and still cover it, which keeps this an index range scan
+        (cam_id, to_ts, from_ts - 2 * SEGMENT_DURATION, from_ts),
+    ).fetchall()
+    conn.close()
+
+    segments = []
+    for row in rows:
+        seg = dict(row)
+        if seg["status"] == "recording":
+            try:
+                st = (RECORDINGS_DIR / seg["path"]).stat()
+            except FileNotFoundError:
+                continue
+            seg["end_ts"] = max(seg["start_ts"], st.st_mtime)
+            seg["bytes"] = st.st_size
+            if seg["end_ts"] <= from_ts:
+                continue
+        segments.append(seg)
+    return segments
+
+
+@app.route("/api/cameras/<int:cam_id>/playback")
+def api_camera_playback(cam_id):
+    """Resolve a time range to recorded segments without re-encoding.
+
+    ``from``/``to`` are epoch seconds or ISO 8601. The default ``format=m3u8``
+    returns an HLS VOD playlist that references the existing segment files
+    (fragmented MP4 via byte ranges, or MPEG-TS). ``format=json`` returns
+    the segment/offset map instead.
+    """
+    try:
+        from_ts = parse_timestamp(request.args.get("from"))
+        to_ts = parse_timestamp(request.args.get("to")) or time.time()
+    except ValueError:
+        return jsonify({"error": "from/to must be epoch seconds or ISO 8601"}), 400
+    if from_ts is None or to_ts <= from_ts:
+        return jsonify({"error": "from is required and must be before to"}), 400
+
+    entries = []
+    for row in _covering_segments(cam_id, from_ts, to_ts):
+        filename = Path(row["path"]).name
+        entries.append({
+            "filename": filename,
+            "url": f"/api/cameras/{cam_id}/recordings/{filename}",
+            "start_ts": row["start_ts"],
+            "end_ts": row["end_ts"],
+            "duration": round(row["end_ts"] - row["start_ts"], 3),
+            "offset": round(max(0.0, from_ts - row["start_ts"]), 3),
+            "end_offset": round(min(row["end_ts"], to_ts) - row["start_ts"], 3),
+            "bytes": row["bytes"],
+            "status": row["status"],
+            "path": RECORDINGS_DIR / row["path"],
+        })
+
+    if request.args.get("format") == "json":
+        for entry in entries:
+            path = entry.pop("path")
+            if path.suffix == ".mp4" and path.exists():
+                entry["init_bytes"] = _mp4_init_size(path)
+        return jsonify({"camera_id": cam_id, "from": from_ts, "to": to_ts, "segments": entries})
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    body, written = [], []
+    for entry in entries:
+        path = entry["path"]
+        if not path.exists():
+            continue
+        if path.suffix == ".ts":
+            body += ["#EXT-X-DISCONTINUITY", f"#EXTINF:{entry['duration']:.3f},", entry["url"]]
+            written.append(entry)
+            continue
+        init = _mp4_init_size(path)
+        if init is None:
+            continue  # non-fragmented MP4 cannot be addressed by HLS
+        size = path.stat().st_size
+        written.append(entry)
+        body += [
+            "#EXT-X-DISCONTINUITY",
+            f'#EXT-X-MAP:URI="{entry["url"]}",BYTERANGE="{init}@0"',
+            f"#EXTINF:{entry['duration']:.3f},",
+            f"#EXT-X-BYTERANGE:{size - init}@{init}",
+            entry["url"],
+        ]
+    if not body:
+        return jsonify({"error": "No playable recordings in range"}), 404
+
+    target = max(entry["duration"] for entry in written)
+    lines.append(f"#EXT-X-TARGETDURATION:{max(1, math.ceil(target))}")
+    # The start offset belongs to the first segment actually in the playlist
+    if written[0]["offset"]:
+        lines.append(f"#EXT-X-START:TIME-OFFSET={written[0]['offset']},PRECISE=YES")
+    # The first DISCONTINUITY tag is redundant before the first segment
+    body.remove("#EXT-X-DISCONTINUITY")
+    lines += body + ["#EXT-X-ENDLIST"]
+    return Response("\n".join(lines) + "\n", mimetype="application/vnd.apple.mpegurl")
+
+
 @app.route("/api/cameras/<int:cam_id>/recordings/<filename>")
 def api_camera_recording_file(cam_id, filename):
-    """Serve a recording segment file."""
+    """Serve a recording segment file.
+
+    ``?follow=1`` on a segment that is still being recorded streams the file
+    as it grows until FFmpeg closes it (fragmented MP4 / MPEG-TS only).
+    """
     cam_dir = RECORDINGS_DIR / str(cam_id)
     filepath = cam_dir / filename
     if not filepath.exists() or not filepath.is_file():
         abort(404)
-    return send_file(filepath, mimetype="video/mp4")
+    mimetype = "video/mp2t" if filepath.suffix == ".ts" else "video/mp4"
+
+    with segment_cache_lock:
+        entry = segment_cache.get(cam_id, {}).get(filename)
+    in_progress = entry is not None and entry["status"] == "recording"
+    if in_progress and request.args.get("follow"):
+        return Response(_follow_segment(cam_id, filepath), mimetype=mimetype)
+
+    # Range requests work on in-progress segments too, up to the current size
+    response = send_file(filepath, mimetype=mimetype, conditional=True)
+    if in_progress:
+        response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _follow_segment(cam_id, filepath, idle_timeout=30):
+    """Yield a growing segment's bytes until it is closed or stops growing."""
+    with open(filepath, "rb") as f:
+        idle_since = time.monotonic()
+        while True:
+            chunk = f.read(256 * 1024)
+            if chunk:
+                idle_since = time.monotonic()
+                yield chunk
+                continue
+            with segment_cache_lock:
+                entry = segment_cache.get(cam_id, {}).get(filepath.name)
+            if entry is None or entry["status"] != "recording":
+                rest = f.read()  # final bytes written before close
+                if rest:
+                    yield rest
+                return
+            if time.monotonic() - idle_since > idle_timeout:
+                return
+            time.sleep(0.5)
+
+
+EVENTS_MAX_LIMIT = 1000
 
 
 @app.route("/api/events", methods=["GET"])
 def api_events_list():
-    """List events with optional filters."""
+    """List events, newest first, with optional filters.
+
+    ``since``/``until`` (epoch seconds or ISO 8601) bound the time range.
+    Paging is keyset-based: when more rows exist the response carries an
+    ``X-Next-Cursor`` header, passed back as ``cursor`` for the next page.
+    """
     camera_id = request.args.get("camera_id", type=int)
     event_type = request.args.get("type")
-    limit = request.args.get("limit", 100, type=int)
+    limit = min(max(request.args.get("limit", 100, type=int), 1), EVENTS_MAX_LIMIT)
+    try:
+        since = parse_timestamp(request.args.get("since"))
+        until = parse_timestamp(request.args.get("until"))
+        cursor = _parse_event_cursor(request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "since/until must be epoch seconds or ISO 8601, "
+                                 "cursor must come from X-Next-Cursor"}), 400
 
     conn = get_db()
     query = """
@@ -552,13 +2606,111 @@ def api_events_list():
     if event_type:
         query += " AND e.event_type = ?"
         params.append(event_type)
-
-    query += " ORDER BY e.timestamp DESC LIMIT ?"
+    if since is not None:
+        query += " AND e.ts_ms >= ?"
+        params.append(round(since * 1000))
+    if until is not None:
+        query += " AND e.ts_ms < ?"
+        params.append(round(until * 1000))
+    if cursor:
+        query += " AND (e.ts_ms, e.id) < (?, ?)"
+        params.extend(cursor)
+
+    query += " ORDER BY e.ts_ms DESC, e.id DESC LIMIT ?"
     params.append(limit)
 
     events = conn.execute(query, params).fetchall()
     conn.close()
-    return jsonify([dict(e) for e in events])
+
+    result = []
+    for e in events:
+        ev = dict(e)
+        ev["playback_url"] = _event_playback_url(ev)
+        result.append(ev)
+    response = jsonify(result)
+    if len(events) == limit:
+        last = events[-1]
+        response.headers["X-Next-Cursor"] = f"{last['ts_ms']}:{last['id']}"
+    return response
+
+
+@app.route("/api/stream/events")
+def api_stream_events():
+    """Server-Sent Events: camera state changes and new events as they happen."""
+    def generate():
+        # Subscribe inside the generator: if the client is gone before the
+        # first chunk, close() on an unstarted generator skips any finally
+        q = event_bus.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    kind, payload = q.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {kind}\ndata: {payload}\n\n"
+        finally:
+            event_bus.unsubscribe(q)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+HISTOGRAM_MAX_HOURS = 24 * 31
+
+
+@app.route("/api/events/histogram")
+def api_events_histogram():
+    """Hourly event counts for the last ``hours`` hours, from the rollups.
+
+    One bucket per hour, oldest first, zero-filled. Without ``camera_id`` the
+    counts are summed over all cameras.
+    """
+    camera_id = request.args.get("camera_id", type=int)
+    event_type = request.args.get("type", "motion")
+    hours = min(max(request.args.get("hours", 48, type=int), 1), HISTOGRAM_MAX_HOURS)
+
+    end_hour = int(time.time()) // 3600 * 3600
+    start_hour = end_hour - (hours - 1) * 3600
+    query = """SELECT hour_ts, SUM(count) AS count FROM event_rollups
+               WHERE event_type = ? AND hour_ts >= ?"""
+    params = [event_type, start_hour]
+    if camera_id:
+        query += " AND camera_id = ?"
+        params.append(camera_id)
+    query += " GROUP BY hour_ts"
+
+    conn = get_db()
+    counts = {row["hour_ts"]: row["count"] for row in conn.execute(query, params)}
+    conn.close()
+    return jsonify({
+        "type": event_type,
+        "camera_id": camera_id,
+        "bucket_seconds": 3600,
+        "buckets": [
+            {"ts": ts, "count": counts.get(ts, 0)}
+            for ts in range(start_hour, end_hour + 1, 3600)
+        ],
+    })
+
+
+def _parse_event_cursor(value):
+    if not value:
+        return None
+    ts_ms, _, event_id = value.partition(":")
+    return int(ts_ms), int(event_id)
+
+
+def _event_playback_url(ev):
+    """Recording URL seeked to the event (media fragment), or None."""
+    if not ev.get("segment_path"):
+        return None
+    cam_id, _, filename = ev["segment_path"].partition("/")
+    return f"/api/cameras/{cam_id}/recordings/{filename}#t={ev['segment_offset']:.1f}"
 
 
 @app.route("/api/events", methods=["POST"])
@@ -580,6 +2732,92 @@ def api_events_create():
     return jsonify({"status": "ok"})
 
 
+@app.route("/api/cameras/<int:cam_id>/exports", methods=["POST"])
+def api_camera_export(cam_id):
+    """Start exporting a time range as one clip (stream copy, no re-encode)."""
+    data = request.get_json() or {}
+    try:
+        from_ts = parse_timestamp(data.get("from"))
+        to_ts = parse_timestamp(data.get("to"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "from/to must be epoch seconds or ISO 8601"}), 400
+    if from_ts is None or to_ts is None or to_ts <= from_ts:
+        return jsonify({"error": "from and to are required, from before to"}), 400
+    if to_ts - from_ts > EXPORT_MAX_SECONDS:
+        return jsonify({"error": f"Exports are limited to {EXPORT_MAX_SECONDS // 3600} hours"}), 400
+
+    try:
+        job = submit_export(cam_id, from_ts, to_ts)
+    except ExportNotReady as e:
+        response = jsonify({
+            "error": "Range includes a segment still being recorded; retry once it closes",
+            "retry_after": e.retry_after,
+        })
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 409
+    if job is None:
+        return jsonify({"error": "No recordings in range"}), 404
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/api/exports/<job_id>")
+def api_export_status(job_id):
+    """Progress of an export job."""
+    with export_lock:
+        job = export_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@app.route("/api/exports/<job_id>/file")
+def api_export_file(job_id):
+    """Download a finished export."""
+    with export_lock:
+        job = export_jobs.get(job_id)
+    if job is None or job.status != "done" or not job.path.exists():
+        abort(404)
+    os.utime(job.path)  # LRU touch
+    return send_file(job.path, mimetype="video/mp4", as_attachment=True,
+                     download_name=job.filename)
+
+
+@app.route("/api/recordings/status")
+def api_recordings_status():
+    """Supervisor state and FFmpeg progress for every recorder."""
+    with recording_lock:
+        sups = list(recorders.values())
+    return jsonify([sup.status() for sup in sups])
+
+
+@app.route("/api/cameras/<int:cam_id>/recording")
+def api_camera_recording_status(cam_id):
+    """Supervisor state and FFmpeg progress for one camera's recorder."""
+    with recording_lock:
+        sup = recorders.get(cam_id)
+    if sup is None:
+        return jsonify({"camera_id": cam_id, "state": "stopped"})
+    return jsonify(sup.status())
+
+
+@app.route("/api/metrics")
+def api_metrics():
+    """Internal counters for monitoring."""
+    with stream_hubs_lock:
+        hubs = list(stream_hubs.values())
+    with mosaic_hubs_lock:
+        mosaics = list(mosaic_hubs.values())
+    with health_metrics_lock:
+        health = dict(health_metrics)
+    return jsonify({
+        "health_check": health,
+        "event_writer": event_writer.stats(),
+        "event_bus": event_bus.stats(),
+        "stream_hubs": [hub.stats() for hub in hubs],
+        "mosaic_hubs": [hub.stats() for hub in mosaics],
+    })
+
+
 # ---------------------------------------------------------------------------
 # Page routes
 # ---------------------------------------------------------------------------
@@ -599,21 +2837,51 @@ def main():
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--recordings-dir", default=str(DEFAULT_RECORDINGS_DIR))
     parser.add_argument("--max-age-hours", type=int, default=48)
+    parser.add_argument("--max-disk-gb", type=float, default=None,
+                        help="Total recordings budget; oldest segments are evicted first")
+    parser.add_argument("--camera-quota-gb", type=float, default=None,
+                        help="Default per-camera recordings budget")
     parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--recording-mode", choices=RECORDING_MODES, default="auto",
+                        help="Default recording mode; cameras can override it")
+    parser.add_argument("--recording-format", choices=RECORDING_FORMATS, default="fmp4",
+                        help="Segment container (fmp4/ts stay playable while recording)")
     args = parser.parse_args()
 
     RECORDINGS_DIR = Path(args.recordings_dir)
     RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
+    recordings_watcher.root = RECORDINGS_DIR
+
+    global EXPORTS_DIR
+    EXPORTS_DIR = RECORDINGS_DIR / "exports"
 
-    global MAX_AGE_HOURS
+    global MAX_AGE_HOURS, RECORDING_MODE, MAX_DISK_GB, CAMERA_QUOTA_GB, RECORDING_FORMAT
     MAX_AGE_HOURS = args.max_age_hours
+    RECORDING_FORMAT = args.recording_format
+    MAX_DISK_GB = args.max_disk_gb
+    CAMERA_QUOTA_GB = args.camera_quota_gb
+    RECORDING_MODE = args.recording_mode
 
     init_db()
+    reindex_segments()
+    load_segment_cache()
+    thumbnail_worker.start()
+    if recordings_watcher.start():
+        log.info("Watching recordings directory with inotify")
+    else:
+        log.info("inotify unavailable; segment index fed by FFmpeg segment lists only")
     start_background_tasks()
 
+    # Turn SIGTERM (systemd stop) into a normal exit so atexit flushes events
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     log.info(f"Starting surveillance server on {args.host}:{args.port}")
     log.info(f"Recordings directory: {RECORDINGS_DIR}")
     log.info(f"Rolling window: {MAX_AGE_HOURS} hours")
+    if MAX_DISK_GB or CAMERA_QUOTA_GB:
+        log.info(f"Disk budget: {MAX_DISK_GB or '-'} GB total, "
+                 f"{CAMERA_QUOTA_GB or '-'} GB per camera")
+    log.info(f"Default recording mode: {RECORDING_MODE}, format: {RECORDING_FORMAT}")
 
     app.run(host=args.host, port=args.port, threaded=True, debug=False)
 